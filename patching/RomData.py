@@ -1,15 +1,48 @@
-from collections.abc import Collection
-from typing import Optional
-
+import logging
+import os
+import struct
+import time
+from collections.abc import Callable, Collection, Hashable, Iterable
+from typing import Any, BinaryIO, Optional
+
+from .tables import RecordTable
 from .z80asm.Assembler import GameboyAddress
 from .z80asm.Util import hex_str
 
+U16LE = struct.Struct("<H")
+U16BE = struct.Struct(">H")
+FAR_POINTER = struct.Struct("<BH")
+
+CHEST_TABLE = RecordTable("ChestRecord", "BBBB", ("position", "room", "item_id", "item_subid"), terminator=0xff)
+
+
+def _table_format(fmt: str) -> str:
+    """
+    Gameboy data is little endian and unaligned, so formats without an explicit byte order default to "<".
+    """
+    return fmt if fmt[:1] in ("<", ">", "!", "=", "@") else "<" + fmt
+
+
+def _span_touched(span: tuple[int, int, int, int], start: int, end: int) -> bool:
+    """
+    Tells if a write to [start, end) changes a byte watched by an index span.
+    A span is (span_start, span_end, stride, width): inside [span_start, span_end), only the first width bytes of each
+    stride-sized record are watched.
+    """
+    span_start, span_end, stride, width = span
+    start = max(start, span_start)
+    end = min(end, span_end)
+    if start >= end:
+        return False
+    in_record = (start - span_start) % stride
+    return in_record < width or start + stride - in_record < end
+
 
 class RomData:
     """
     A class that creates methods that are necessary for ROM Handling.
     """
-    buffer: bytearray
+    file: bytearray
 
     def __init__(self, file: bytes, name: Optional[str] = None) -> None:
         """
@@ -21,6 +54,43 @@ class RomData:
         """
         self.file = bytearray(file)
         self.name = name
+        self._indexes: dict[Hashable, tuple[Any, list[tuple[int, int, int, int]]]] = {}
+
+    @classmethod
+    def from_buffer(cls, buffer: bytearray, name: Optional[str] = None) -> "RomData":
+        """
+        Wraps an existing buffer without copying it, so that edits made through this class are visible in the buffer.
+
+        Parameters:
+            buffer (bytearray): A mutable buffer from a rom file.
+            name (Optional[str]): The name of the provided file.
+
+        Returns:
+            RomData: The ROM sharing the given buffer.
+        """
+        rom = cls.__new__(cls)
+        rom.file = buffer
+        rom.name = name
+        rom._indexes = {}
+        return rom
+
+    @classmethod
+    def from_file(cls, path: str | os.PathLike, name: Optional[str] = None) -> "RomData":
+        """
+        Loads a rom file by reading it straight into the buffer of the class, without any intermediate copy.
+
+        Parameters:
+            path (str | os.PathLike): The path of the rom file.
+            name (Optional[str]): The name of the provided file.
+
+        Returns:
+            RomData: The loaded ROM.
+        """
+        with open(path, "rb") as f:
+            buffer = bytearray(os.fstat(f.fileno()).st_size)
+            read_size = f.readinto(buffer)
+        del buffer[read_size:]
+        return cls.from_buffer(buffer, name)
 
     def read_bit(self, address: int, bit_number: int) -> bool:
         """
@@ -34,7 +104,7 @@ class RomData:
             bool: When a bit is 0, then it's false. True otherwise.
         """
         bitflag = (1 << bit_number)
-        return (self.buffer[address] & bitflag) != 0
+        return (self.file[address] & bitflag) != 0
 
     def read_byte(self, address: int) -> int:
         """
@@ -60,7 +130,31 @@ class RomData:
         """
         return self.file[start_address:start_address + length]
 
-    def read_word(self, address: int):
+    def read_u8(self, address: int) -> int:
+        """
+        Reads an unsigned byte from a given memory address.
+
+        Parameters:
+            address (int): A memory address to read from
+
+        Returns:
+            int: The byte stored at the memory address.
+        """
+        return self.file[address]
+
+    def read_u16le(self, address: int) -> int:
+        """
+        Reads an unsigned little endian word from a given memory address.
+
+        Parameters:
+            address (int): A memory address to read from
+
+        Returns:
+            int: The word stored at the memory address.
+        """
+        return U16LE.unpack_from(self.file, address)[0]
+
+    def read_word(self, address: int) -> int:
         """
         Reads a word from a given memory address.
 
@@ -68,10 +162,41 @@ class RomData:
             address (int): A memory address to read from
 
         Returns:
-            str: A word that is returned as a result of reading the memory address.
+            int: A word that is returned as a result of reading the memory address.
+        """
+        return U16LE.unpack_from(self.file, address)[0]
+
+    def read_far_pointer(self, address: int) -> int:
+        """
+        Reads a 3 bytes pointer (bank, then little endian word) and converts it to an address in the ROM.
+
+        Parameters:
+            address (int): The memory address of the bank byte.
+
+        Returns:
+            int: The address in the ROM the pointer points to.
+        """
+        bank, offset = FAR_POINTER.unpack_from(self.file, address)
+        return GameboyAddress(bank, offset).address_in_rom()
+
+    def read_table(self, address: int, fmt: str, count: int) -> list[tuple]:
+        """
+        Reads a table of fixed-size records in a single call.
+
+        Parameters:
+            address (int): The memory address of the first record.
+            fmt (str): A struct format describing one record, little endian if no byte order is given.
+            count (int): The number of records to read.
+
+        Returns:
+            list[tuple]: The unpacked records.
         """
-        word_bytes = self.read_bytes(address, 2)
-        return (word_bytes[1] * 0x100) + word_bytes[0]
+        fmt = _table_format(fmt)
+        end = address + struct.calcsize(fmt) * count
+        if end > len(self.file):
+            raise ValueError(f"Table at {hex(address)} goes past the end of the ROM")
+        with memoryview(self.file) as view:
+            return list(struct.iter_unpack(fmt, view[address:end]))
 
     def write_byte(self, address: int, value: int) -> None:
         """
@@ -81,6 +206,8 @@ class RomData:
             address (int): A memory address used for writing.
             value (int): A value that will be written to the provided memory address.
         """
+        if self._indexes:
+            self.invalidate_indexes(address, address + 1)
         self.file[address] = value
 
     def write_bytes(self, start_address: int, values: Collection[int]) -> None:
@@ -91,6 +218,8 @@ class RomData:
             address (int): A memory address used for writing.
             values (Collection[int]): Values that will be written to the provided memory address.
         """
+        if self._indexes:
+            self.invalidate_indexes(start_address, start_address + len(values))
         self.file[start_address:start_address + len(values)] = values
 
     def write_word(self, address: int, value: int) -> None:
@@ -101,8 +230,9 @@ class RomData:
             address (int): A memory address used for writing.
             value (int): A value that will be written to the provided memory address.
         """
-        value = value & 0xFFFF
-        self.write_bytes(address, [value & 0xFF, (value >> 8) & 0xFF])
+        if self._indexes:
+            self.invalidate_indexes(address, address + 2)
+        U16LE.pack_into(self.file, address, value & 0xFFFF)
 
     def write_word_be(self, address: int, value: int) -> None:
         """
@@ -112,8 +242,76 @@ class RomData:
             address (int): A memory address used for writing.
             value (int): A value that will be written to the provided memory address.
         """
-        value = value & 0xFFFF
-        self.write_bytes(address, [(value >> 8) & 0xFF, value & 0xFF])
+        if self._indexes:
+            self.invalidate_indexes(address, address + 2)
+        U16BE.pack_into(self.file, address, value & 0xFFFF)
+
+    def write_far_pointer(self, address: int, pointer: GameboyAddress) -> None:
+        """
+        Writes down a 3 bytes pointer (bank, then little endian word) to the ROM.
+
+        Parameters:
+            address (int): A memory address used for writing.
+            pointer (GameboyAddress): The address the pointer should point to.
+        """
+        if self._indexes:
+            self.invalidate_indexes(address, address + 3)
+        FAR_POINTER.pack_into(self.file, address, pointer.bank, pointer.to_word_int())
+
+    def write_table(self, address: int, fmt: str, records: Iterable[tuple]) -> int:
+        """
+        Writes down a table of fixed-size records to the ROM.
+
+        Parameters:
+            address (int): The memory address of the first record.
+            fmt (str): A struct format describing one record, little endian if no byte order is given.
+            records (Iterable[tuple]): The records to pack.
+
+        Returns:
+            int: The address right after the last written record.
+        """
+        record = struct.Struct(_table_format(fmt))
+        start_address = address
+        for values in records:
+            record.pack_into(self.file, address, *values)
+            address += record.size
+        if self._indexes:
+            self.invalidate_indexes(start_address, address)
+        return address
+
+    def get_index(self, key: Hashable, build: Callable[[], tuple[Any, list[tuple[int, int, int, int]]]]) -> Any:
+        """
+        Returns a lookup structure built over a fixed-record table of the ROM, building it on first use.
+        It stays cached on this instance until a write through this class touches one of its watched spans.
+
+        Parameters:
+            key (Hashable): A key identifying the index (e.g. the table name and address).
+            build (Callable): Builds the index, returning it along with the list of spans it depends on.
+                A span is (start, end, stride, width): inside [start, end), only the first width bytes of each
+                stride-sized record are watched, so that writing non-key fields keeps the index alive.
+
+        Returns:
+            Any: The index returned by build.
+        """
+        entry = self._indexes.get(key)
+        if entry is None:
+            entry = build()
+            self._indexes[key] = entry
+        return entry[0]
+
+    def invalidate_indexes(self, start: int, end: int) -> None:
+        """
+        Drops every cached index depending on bytes in [start, end).
+        This is done automatically by write methods, but must be called when editing self.file directly.
+
+        Parameters:
+            start (int): The first modified address.
+            end (int): The address after the last modified one.
+        """
+        stale_keys = [key for key, (_, spans) in self._indexes.items()
+                      if any(_span_touched(span, start, end) for span in spans)]
+        for key in stale_keys:
+            del self._indexes[key]
 
     def add_bank(self, fill: int) -> None:
         """
@@ -142,11 +340,8 @@ class RomData:
         Parameters:
             address (int): The memory address used for updating a game's checksum.
         """
-        result = 0
-        for b in self.read_bytes(0x0, address):
-            result += b
-        for b in self.read_bytes(address + 2, 0xffffff):
-            result += b
+        with memoryview(self.file) as view:
+            result = sum(view[:address]) + sum(view[address + 2:])
         result &= 0xffff
         self.write_word_be(address, result & 0xffff)
 
@@ -161,6 +356,55 @@ class RomData:
         else:
             raise ValueError(f"Invalid ROM size: {hex(len(self.file))}")
 
+    def finalize(self, checksum_address: int = 0x14E) -> dict[str, float]:
+        """
+        Fixes up the header once patching is done: ROM size, header checksum, then global checksum.
+        The global checksum is computed in a single pass over the buffer, after both header edits since it covers them.
+        This replaces calling update_rom_size, update_header_checksum and update_checksum in the right order.
+
+        Parameters:
+            checksum_address (int): The memory address of the big endian global checksum.
+
+        Returns:
+            dict[str, float]: The time spent in each stage, in seconds.
+
+        Raises:
+            ValueError: Invalid ROM size: {SIZE}
+            ValueError: The header or the global checksum is inconsistent after being fixed up.
+        """
+        timings = {}
+        start = time.perf_counter()
+        self.update_rom_size()
+        timings["rom_size"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.update_header_checksum()
+        timings["header_checksum"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with memoryview(self.file) as view:
+            total = sum(view)
+        total -= self.file[checksum_address] + self.file[checksum_address + 1]
+        self.write_word_be(checksum_address, total & 0xffff)
+        timings["global_checksum"] = time.perf_counter() - start
+
+        # The buffer is summed again rather than trusting the sum written above, and the checks raise instead of
+        # asserting so that they also run with -O
+        start = time.perf_counter()
+        if self.file[0x148] != (0x05 if len(self.file) == 0x100000 else 0x06):
+            raise ValueError("ROM size byte is inconsistent")
+        if (-0x19 - sum(self.file[0x134:0x14D])) & 0xFF != self.file[0x14D]:
+            raise ValueError("Header checksum is inconsistent")
+        with memoryview(self.file) as view:
+            expected = (sum(view[:checksum_address]) + sum(view[checksum_address + 2:])) & 0xffff
+        if U16BE.unpack_from(self.file, checksum_address)[0] != expected:
+            raise ValueError("Global checksum is inconsistent")
+        timings["verification"] = time.perf_counter() - start
+
+        logging.debug("ROM finalized in %.1f ms (%s)", sum(timings.values()) * 1000,
+                      ", ".join(f"{stage}: {duration * 1000:.1f} ms" for stage, duration in timings.items()))
+        return timings
+
     def get_chest_addr(self, group_and_room: int, bank: int, table_addr: int) -> int:
         """
         Return the address where to edit item ID and sub-ID to modify the contents
@@ -179,19 +423,47 @@ class RomData:
         base_addr = GameboyAddress(bank, table_addr).address_in_rom()
         room = group_and_room & 0xFF
         group = group_and_room >> 8
-        current_addr = GameboyAddress(bank, self.read_word(base_addr + (group * 2))).address_in_rom()
-        while self.read_byte(current_addr) != 0xff:
-            chest_room = self.read_byte(current_addr + 1)
-            if chest_room == room:
-                return current_addr + 2
-            current_addr += 4
-        raise Exception(f"Unknown chest in room {group}|{hex_str(room)}")
+        chests = self.get_index(("chests", base_addr, group), lambda: self._build_chest_index(base_addr, bank, group))
+        if room not in chests:
+            raise Exception(f"Unknown chest in room {group}|{hex_str(room)}")
+        return chests[room]
+
+    def _build_chest_index(self, base_addr: int, bank: int, group: int) -> tuple[dict[int, int], list[tuple[int, int, int, int]]]:
+        """
+        Maps every room of a group to the address of its chest contents in a single pass over the group's chest table.
+
+        Returns:
+            tuple: The room to address map, and the spans it depends on (group pointer, then positions and rooms).
+        """
+        pointer_addr = base_addr + (group * 2)
+        chests = CHEST_TABLE.bind_near(self, bank, pointer_addr)
+        rooms, spans = chests.build_index("room")
+        chest_addresses = {room: chests.address + index * CHEST_TABLE.size + 2 for room, index in rooms.items()}
+        spans.append((pointer_addr, pointer_addr + 2, 2, 2))
+        return chest_addresses, spans
 
     def output(self) -> bytes:
         """
         Gives the user an output of the ROM.
+        This copies the whole ROM, write_to should be preferred when the output is meant to be written to a file.
 
         Returns:
             bytes: A buffer of a ROM.
         """
         return bytes(self.file)
+
+    def write_to(self, fileobj: BinaryIO) -> int:
+        """
+        Writes the ROM to a binary file object straight from its buffer, without copying it.
+
+        Parameters:
+            fileobj (BinaryIO): A file object opened in binary write mode.
+
+        Returns:
+            int: The number of written bytes.
+        """
+        with memoryview(self.file) as view:
+            written = 0
+            while written < len(view):
+                written += fileobj.write(view[written:])
+        return written
@@ -1,3 +1,11 @@
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
 from ...data import ITEMS_DATA
 
 
@@ -115,3 +123,83 @@ def script_delay(frames: int) -> str:
         return script_delay(240) + script_delay(frames - 240)
     else:
         return f"db setcounter1,${simple_hex(frames)}\n"
+
+
+def write_file_atomically(path: Path, data: bytes) -> None:
+    """
+    Writes a file through a temporary file in the same directory, renamed over it once complete, so that a concurrent
+    reader never sees a partially written file.
+
+    Parameters:
+        path (Path): The file to write.
+        data (bytes): The content of the file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _read_lock(path: Path) -> Optional[tuple[str, float]]:
+    try:
+        with open(path, "r", encoding="utf-8") as lock:
+            return lock.read(), os.fstat(lock.fileno()).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _take_over_lock(path: Path, stale_token: str, token: str) -> None:
+    # The lock is moved away before being removed, so that only one waiter gets it. If it is not the stale lock anymore
+    # because another waiter took it over in the meantime, it is put back.
+    moved_path = path.with_name(f"{path.name}.{token}")
+    try:
+        os.replace(path, moved_path)
+    except FileNotFoundError:
+        return
+    try:
+        if _read_lock(moved_path)[0] != stale_token:
+            os.link(moved_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        moved_path.unlink(missing_ok=True)
+
+
+@contextmanager
+def file_lock(path: Path, stale_after: float = 120, poll_interval: float = 0.05) -> Iterator[None]:
+    """
+    Holds a lock file for the duration of the context, waiting for it if another process or thread holds it.
+    The lock file holds a token unique to its holder, so that a holder whose lock was taken over never removes the lock
+    of another one.
+
+    Parameters:
+        path (Path): The lock file, created while the lock is held.
+        stale_after (float): The age in seconds after which a lock file is considered abandoned and taken over.
+        poll_interval (float): The time in seconds between two attempts at taking the lock.
+    """
+    token = f"{os.getpid()}-{os.urandom(8).hex()}"
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            holder = _read_lock(path)
+            if holder is None:
+                continue
+            holder_token, modified_time = holder
+            if time.time() - modified_time > stale_after:
+                _take_over_lock(path, holder_token, token)
+            else:
+                time.sleep(poll_interval)
+    with os.fdopen(fd, "w", encoding="utf-8") as lock:
+        lock.write(token)
+    try:
+        yield
+    finally:
+        holder = _read_lock(path)
+        if holder is not None and holder[0] == token:
+            path.unlink(missing_ok=True)
@@ -1,26 +1,241 @@
-import json
+import hashlib
+import logging
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator, Mapping, MutableMapping
 from pathlib import Path
+from types import MappingProxyType
+from typing import Optional
 
 import Utils
+from ..Constants import AGES_ROM_HASH, SEASONS_ROM_HASH
 from ..RomData import RomData
-from ..text.decoding import parse_text_dict, parse_all_texts
+from ..text.cache import EncodedTextCache
+from ..text.decoding import parse_text_dict
+from ..text.table import Buffer, TextTable
+from ..Util import file_lock, write_file_atomically
+
+# Layout of the vanilla text store: a header, then a record for every dictionary entry and every text, then the data
+# the records point to. Keys and texts are stored as UTF-8, and encoded texts as found in the ROM.
+# The header holds the hash of the ROM the texts were read from, and a checksum of everything after it.
+TEXT_STORE_MAGIC = b"OOVT"
+TEXT_STORE_VERSION = 2
+TEXT_STORE_HEADER = struct.Struct("<4sH16sII16s")
+# Offset and length of the key, of the text and of the encoded text
+TEXT_STORE_RECORD = struct.Struct("<6I")
+
+# Number of vanilla text stores kept open by the process, the least recently used being dropped first
+VANILLA_TEXT_CACHE_SIZE = 2
+
+
+class _StoredStrings(Mapping[str, str]):
+    """
+    Read-only mapping over a group of records of a vanilla text store, decoding strings when accessed.
+    """
+
+    def __init__(self, data: mmap.mmap, records: dict[str, tuple[int, ...]]) -> None:
+        self._data = data
+        self._records = records
+
+    def __getitem__(self, key: str) -> str:
+        _, _, text_offset, text_length, _, _ = self._records[key]
+        return str(self._data[text_offset:text_offset + text_length], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._records
+
+
+class VanillaTextStore:
+    """
+    The vanilla dictionary and texts of a game, in a binary file mapped in memory.
+    Opening it only reads the keys, strings being decoded when accessed.
+    """
+
+    def __init__(self, path: Path, rom_hash: str) -> None:
+        """
+        Parameters:
+            path (Path): The file of the store.
+            rom_hash (str): The MD5 hash of the ROM the store must have been made from.
+
+        Raises:
+            ValueError: The file is not a store of the current version made from that ROM.
+        """
+        with path.open("rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, stored_hash, dict_count, text_count, checksum = TEXT_STORE_HEADER.unpack_from(self._data, 0)
+            if magic != TEXT_STORE_MAGIC or version != TEXT_STORE_VERSION:
+                raise ValueError(f"{path} is not a vanilla text store of version {TEXT_STORE_VERSION}")
+            if stored_hash != bytes.fromhex(rom_hash):
+                raise ValueError(f"{path} was made from another ROM")
+            if checksum != _store_checksum(memoryview(self._data)[TEXT_STORE_HEADER.size:]):
+                raise ValueError(f"{path} is corrupted")
+
+            records_end = TEXT_STORE_HEADER.size + (dict_count + text_count) * TEXT_STORE_RECORD.size
+            records = []
+            for record in TEXT_STORE_RECORD.iter_unpack(self._data[TEXT_STORE_HEADER.size:records_end]):
+                key_offset, key_length = record[:2]
+                records.append((str(self._data[key_offset:key_offset + key_length], "utf-8"), record))
+        except (struct.error, UnicodeDecodeError):
+            self._data.close()
+            raise ValueError(f"{path} is corrupted")
+        except ValueError:
+            self._data.close()
+            raise
+        self._dict_records = dict(records[:dict_count])
+        self._text_records = dict(records[dict_count:])
+        self._shared_dictionary: Optional[Mapping[str, str]] = None
+
+    @property
+    def dictionary(self) -> Mapping[str, str]:
+        return _StoredStrings(self._data, self._dict_records)
+
+    @property
+    def shared_dictionary(self) -> Mapping[str, str]:
+        """
+        The dictionary decoded once and shared by every user of the store, as a read-only mapping.
+        """
+        if self._shared_dictionary is None:
+            self._shared_dictionary = MappingProxyType(dict(self.dictionary))
+        return self._shared_dictionary
+
+    @property
+    def texts(self) -> Mapping[str, str]:
+        return _StoredStrings(self._data, self._text_records)
+
+    def text_table(self) -> TextTable:
+        """
+        Builds a TextTable over the encoded texts of the store, which keeps their vanilla bytes when written back.
+        Texts stored without their encoding are taken decoded, and encoded again when written.
+        """
+        addresses = {}
+        texts = {}
+        for key, (_, _, text_offset, text_length, encoded_offset, encoded_length) in self._text_records.items():
+            addresses[key] = encoded_offset
+            if encoded_length == 0:
+                texts[key] = str(self._data[text_offset:text_offset + text_length], "utf-8")
+        return TextTable.from_encoded(self.shared_dictionary, self._data, addresses, texts)
+
+    @staticmethod
+    def build(rom_hash: str,
+              dictionary: dict[str, str],
+              texts: dict[str, str],
+              encoded: Optional[dict[str, bytes]] = None) -> bytes:
+        """
+        Serializes a vanilla text store.
+
+        Parameters:
+            rom_hash (str): The MD5 hash of the ROM the texts were read from.
+            dictionary (dict[str, str]): The dictionary entries.
+            texts (dict[str, str]): The texts.
+            encoded (Optional[dict[str, bytes]]): The bytes of every text in the ROM, if known. Texts stored without
+                them are encoded again when written.
+
+        Returns:
+            bytes: The content of the store file.
+        """
+        encoded = encoded or {}
+        entries = [(key, text, b"") for key, text in dictionary.items()]
+        entries.extend((key, text, encoded.get(key, b"")) for key, text in texts.items())
+
+        records = []
+        blobs = []
+        offset = TEXT_STORE_HEADER.size + len(entries) * TEXT_STORE_RECORD.size
+        for key, text, encoded_text in entries:
+            record = []
+            for blob in (key.encode("utf-8"), text.encode("utf-8"), encoded_text):
+                record.extend((offset, len(blob)))
+                blobs.append(blob)
+                offset += len(blob)
+            records.append(TEXT_STORE_RECORD.pack(*record))
+
+        body = b"".join([*records, *blobs])
+        header = TEXT_STORE_HEADER.pack(TEXT_STORE_MAGIC, TEXT_STORE_VERSION, bytes.fromhex(rom_hash),
+                                        len(dictionary), len(texts), _store_checksum(body))
+        return header + body
+
+
+def _store_checksum(body: Buffer) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def _vanilla_rom_hash(seasons: bool) -> str:
+    return SEASONS_ROM_HASH if seasons else AGES_ROM_HASH
+
+
+def _text_store_lock_path(seasons: bool) -> Path:
+    return _text_store_path(seasons).with_suffix(".lock")
+
+
+def _text_store_path(seasons: bool) -> Path:
+    game_name = "seasons" if seasons else "ages"
+    return Path(Utils.cache_path("oos_ooa/text")).joinpath(f"{game_name}_texts.bin")
+
+
+_vanilla_text_cache: OrderedDict[tuple, VanillaTextStore] = OrderedDict()
+_vanilla_text_cache_lock = threading.Lock()
+
+
+def load_vanilla_text_store(seasons: bool) -> Optional[VanillaTextStore]:
+    """
+    Opens the vanilla text store of a game.
+    Stores are kept open by the process, keyed by the modification time and size of their file, so that patching many
+    seeds only opens them once.
+
+    Parameters:
+        seasons (bool): Opens the store of seasons if true, otherwise ages.
+
+    Returns:
+        Optional[VanillaTextStore]: The store, or None if it doesn't exist yet or wasn't made from the vanilla ROM.
+    """
+    store_file = _text_store_path(seasons)
+    try:
+        stat = store_file.stat()
+    except OSError:
+        return None
+    key = (seasons, str(store_file), stat.st_mtime_ns, stat.st_size)
+
+    with _vanilla_text_cache_lock:
+        store = _vanilla_text_cache.get(key)
+        if store is not None:
+            _vanilla_text_cache.move_to_end(key)
+            return store
+
+    try:
+        store = VanillaTextStore(store_file, _vanilla_rom_hash(seasons))
+    except (OSError, ValueError):
+        return None
+
+    # Stores dropped from the cache are closed once the last table using them is gone
+    with _vanilla_text_cache_lock:
+        _vanilla_text_cache[key] = store
+        while len(_vanilla_text_cache) > VANILLA_TEXT_CACHE_SIZE:
+            _vanilla_text_cache.popitem(last=False)
+    return store
 
 
 def load_vanilla_dict_data(seasons: bool) -> None | dict[str, str]:
     """
-    Gets the vanilla dict, this is always assumed to already exist
+    Gets the vanilla dict.
 
     Parameters:
         seasons (bool): Gets the dict from seasons if true, otherwise ages.
 
     Returns:
-        dict[str, str]: A dictonary full of things from a game.
+        dict[str, str]: A dictonary full of things from a game, or None if it wasn't saved yet.
     """
-    game_name = "seasons" if seasons else "ages"
-
-    text_dir = Path(Utils.cache_path("oos_ooa/text"))
-    vanilla_text_file = text_dir.joinpath(f"{game_name}_dict.json")
-    return json.load(open(vanilla_text_file, encoding="utf-8"))
+    store = load_vanilla_text_store(seasons)
+    if store is None:
+        return None
+    return dict(store.dictionary)
 
 
 def load_vanilla_text_data(seasons: bool) -> None | dict[str, str]:
@@ -31,20 +246,19 @@ def load_vanilla_text_data(seasons: bool) -> None | dict[str, str]:
         seasons (bool): Gets the text from from seasons if true, otherwise ages.
 
     Returns:
-        dict[str, str]: A text from a game.
+        dict[str, str]: A text from a game, or None if it wasn't saved yet.
     """
-    game_name = "seasons" if seasons else "ages"
-
-    text_dir = Path(Utils.cache_path("oos_ooa/text"))
-    vanilla_text_file = text_dir.joinpath(f"{game_name}_texts_vanilla.json")
-    if not vanilla_text_file.is_file():
+    store = load_vanilla_text_store(seasons)
+    if store is None:
         return None
-    return json.load(open(vanilla_text_file, encoding="utf-8"))
+    return dict(store.texts)
 
 
 def save_vanilla_text_data(dictionary: dict[str, str],
                            texts: dict[str, str],
-                           seasons: bool) -> None:
+                           seasons: bool,
+                           encoded: Optional[dict[str, bytes]] = None,
+                           rom_hash: Optional[str] = None) -> None:
     """
     Saves the vanilla text data somewhere.
 
@@ -52,24 +266,28 @@ def save_vanilla_text_data(dictionary: dict[str, str],
         dictionary (dict[str, str]): The directory to work with.
         texts ([dict[str, str]]): A list of texts that will be saved.
         seasons (bool): Saves the text from from seasons if true, otherwise ages.
+        encoded (Optional[dict[str, bytes]]): The bytes of every text in the ROM, if known.
+        rom_hash (Optional[str]): The MD5 hash of the ROM the texts were read from, the vanilla one if not given.
     """
-    text_dir = Path(Utils.cache_path("oos_ooa/text"))
-    text_dir.mkdir(parents=True, exist_ok=True)
-
-    game_name = "seasons" if seasons else "ages"
-    dict_file = text_dir.joinpath(f"{game_name}_dict.json")
-    text_file = text_dir.joinpath(f"{game_name}_texts_vanilla.json")
-
-    with dict_file.open("w", encoding="utf-8") as f:
-        json.dump(dictionary, f, ensure_ascii=False)
+    store_file = _text_store_path(seasons)
+    store_file.parent.mkdir(parents=True, exist_ok=True)
 
-    with text_file.open("w", encoding="utf-8") as f:
-        json.dump(texts, f, ensure_ascii=False)
+    if rom_hash is None:
+        rom_hash = _vanilla_rom_hash(seasons)
+    try:
+        write_file_atomically(store_file, VanillaTextStore.build(rom_hash, dictionary, texts, encoded))
+    except OSError as error:
+        # The store is only a cache, texts will just be parsed again next time
+        logging.warning(f"Could not save the vanilla text data to {store_file}: {error}")
 
 
-def get_text_data(rom_data: RomData, get_dictionary: bool, seasons: bool) -> tuple[None | dict[str, str], dict[str, str]]:
+def get_text_data(rom_data: RomData,
+                  get_dictionary: bool,
+                  seasons: bool) -> tuple[None | Mapping[str, str], MutableMapping[str, str]]:
     """
     Gets the text data.
+    The dictionary is shared and read-only, and the texts are a TextTable of their own, decoded when accessed and
+    changed without affecting other callers.
 
     Parameters:
         rom_data (RomData): Data of a rom that was loaded.
@@ -77,17 +295,50 @@ def get_text_data(rom_data: RomData, get_dictionary: bool, seasons: bool) -> tup
         seasons (bool): True if the rom that is loaded is called The Legend of Zelda: Oracle of Seasons, If so, then this function will behave differently.
 
     Returns:
-        dict[str, str]: A text from a game.
-    """
-    result = load_vanilla_text_data(seasons)
-    if result is not None:
-        if get_dictionary:
-            dictionary = load_vanilla_dict_data(seasons)
-        else:
-            dictionary = None
-        return dictionary, result
-
-    dictionary = parse_text_dict(rom_data, seasons)
-    texts = parse_all_texts(rom_data, dictionary, seasons)
-    save_vanilla_text_data(dictionary, texts, seasons)
-    return dictionary, texts
+        tuple: The dictionary and the texts from a game.
+    """
+    store = load_vanilla_text_store(seasons)
+    if store is None:
+        # Only a store made from the vanilla ROM is ever loaded, so the texts of another ROM are not saved, and are
+        # parsed without waiting for other workers. The ROM is hashed in place, and only on a cold cache.
+        if hashlib.md5(rom_data.file).hexdigest() != _vanilla_rom_hash(seasons):
+            logging.warning("The ROM is not the vanilla one, its texts are parsed without being cached")
+            dictionary = parse_text_dict(rom_data, seasons)
+            return dictionary, TextTable(rom_data, dictionary, seasons)
+
+        # Only one worker parses the ROM on a cold cache, the others wait for it and use its store
+        lock_file = _text_store_lock_path(seasons)
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(lock_file):
+            store = load_vanilla_text_store(seasons)
+            if store is None:
+                dictionary = parse_text_dict(rom_data, seasons)
+                texts = TextTable(rom_data, dictionary, seasons)
+                save_vanilla_text_data(dictionary,
+                                       {key: texts[key] for key in texts},
+                                       seasons,
+                                       {key: texts.original_bytes(key) for key in texts})
+                return dictionary, texts
+
+    if get_dictionary:
+        dictionary = store.shared_dictionary
+    else:
+        dictionary = None
+    return dictionary, store.text_table()
+
+
+def get_encoded_text_cache(seasons: bool) -> EncodedTextCache:
+    """
+    Gets the persistent cache of encoded texts, stored next to the vanilla text data.
+    Passing it to write_text_data avoids encoding again the texts which were already encoded by a previous patch.
+
+    Parameters:
+        seasons (bool): Gets the cache for seasons if true, otherwise ages.
+
+    Returns:
+        EncodedTextCache: The cache of encoded texts for that game.
+    """
+    game_name = "seasons" if seasons else "ages"
+
+    text_dir = Path(Utils.cache_path("oos_ooa/text"))
+    return EncodedTextCache(text_dir.joinpath(f"{game_name}_texts_encoded.bin"))
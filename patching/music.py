@@ -2,6 +2,9 @@ import random
 from enum import Enum
 from typing import List, Tuple, Dict, Set, Any
 
+from .RomData import RomData
+from .tables import RecordTable
+
 class Game(Enum):
     Seasons = 1
     Ages = 2
@@ -13,6 +16,8 @@ SOUND_POINTER_TABLE_OFFSETS = {
 }
 SOUND_PTR_SIZE = 3
 SOUND_PTR_ADDR_IS_LITTLE_ENDIAN = True
+SOUND_POINTER_TABLE = RecordTable("SoundPointer", ("<" if SOUND_PTR_ADDR_IS_LITTLE_ENDIAN else ">") + "BH",
+                                  ("bank", "address"), count=0xd5, pointers={"address": "bank"})
 
 UNUSED_INDICES = {0x00, 0x37, 0x3a, 0x3b, 0x41, 0x42, 0x43, 0x44, 0x45,
                   0x47, 0x48, 0x49, 0x4b, 0x97}
@@ -40,18 +45,13 @@ BASE_SFX_INDICES = set(range(0x4c, 0xd5)) - UNUSED_INDICES - LOOPING_SFX_INDICES
 def format_offset(offset: int) -> str:
     return f"0x{offset:04x}"
 
-def read_sound_ptr(view: memoryview, offset: int) -> Tuple[int, int]:
-    bank_offset = view[offset]
-    addr = int.from_bytes(view[offset+1:offset+3], byteorder='little' if SOUND_PTR_ADDR_IS_LITTLE_ENDIAN else 'big')
+def check_sound_ptr(ptr: Tuple[int, int], offset: int) -> Tuple[int, int]:
+    bank_offset, addr = ptr
     if bank_offset > 0x3f or addr < 0x4000 or addr > 0x7fff:
         msg = 'Read invalid sound pointer at ' + format_offset(offset)
         raise ValueError(msg)
     return (bank_offset, addr)
 
-def write_sound_ptr(view: memoryview, offset: int, ptr: Tuple[int, int]) -> None:
-    view[offset] = ptr[0]
-    view[offset+1:offset+3] = ptr[1].to_bytes(2, byteorder='little' if SOUND_PTR_ADDR_IS_LITTLE_ENDIAN else 'big')
-
 def shuffle(array: List[Any]) -> List[Any]:
     """Fisher-Yates shuffle algorithm"""
     copy = array.copy()
@@ -60,20 +60,30 @@ def shuffle(array: List[Any]) -> List[Any]:
         copy[i], copy[j] = copy[j], copy[i]
     return copy
 
-def shuffle_audio(rom: bytearray, indices: Set[int], game: Game) -> None:
-    view = memoryview(rom)
-    offset = SOUND_POINTER_TABLE_OFFSETS[game]
-    ptrs = [read_sound_ptr(view, offset + i * SOUND_PTR_SIZE) for i in indices]
+def shuffle_audio(rom: RomData | bytearray, indices: Set[int], game: Game) -> None:
+    if not isinstance(rom, RomData):
+        rom = RomData.from_buffer(rom)
+    table = SOUND_POINTER_TABLE.bind(rom, SOUND_POINTER_TABLE_OFFSETS[game])
+    all_ptrs = table.raw_records()
+    ptrs = [check_sound_ptr(all_ptrs[i], table.address_of(i)) for i in indices]
     shuffled_ptrs = shuffle(ptrs)
     for i, ptr in zip(indices, shuffled_ptrs):
-        write_sound_ptr(view, offset + i * SOUND_PTR_SIZE, ptr)
+        table.write(i, ptr)
 
-def shuffle_music(rom: bytearray, game: Game) -> bytes:
+def shuffle_music_in_place(rom: RomData | bytearray, game: Game) -> None:
     indices = BASE_MUSIC_INDICES.union(GAME_SPECIFIC_MUSIC_INDICES[game])
     shuffle_audio(rom, indices, game)
-    return bytes(rom)
 
-def shuffle_sfx(rom: bytearray, game: Game) -> bytes:
+def shuffle_sfx_in_place(rom: RomData | bytearray, game: Game) -> None:
     indices = BASE_SFX_INDICES.union(GAME_SPECIFIC_SFX_INDICES[game])
     shuffle_audio(rom, indices, game)
-    return bytes(rom)
\ No newline at end of file
+
+def shuffle_music(rom: bytearray, game: Game) -> bytes:
+    """Copying variant of shuffle_music_in_place, prefer the latter when patching a RomData"""
+    shuffle_music_in_place(rom, game)
+    return bytes(rom)
+
+def shuffle_sfx(rom: bytearray, game: Game) -> bytes:
+    """Copying variant of shuffle_sfx_in_place, prefer the latter when patching a RomData"""
+    shuffle_sfx_in_place(rom, game)
+    return bytes(rom)
@@ -0,0 +1,9 @@
+from ..tables import RecordTable
+
+# One record per group: room type, far pointer to the room infos (preceded by the dict for big rooms), far pointer to the
+# compressed room data, and an unused byte
+ROOM_LAYOUT_GROUP_TABLE = RecordTable("RoomLayoutGroup", "BBHBHB",
+                                      ("room_type", "table_bank", "table_offset", "data_bank", "data_offset", "unused"),
+                                      pointers={"table_offset": "table_bank", "data_offset": "data_bank"})
+
+ROOM_INFO_TABLE = RecordTable("RoomInfo", "H", ("room_info",), count=0x100)
@@ -1,67 +1,163 @@
+from . import ROOM_INFO_TABLE, ROOM_LAYOUT_GROUP_TABLE
 from ..RomData import RomData
 from ..z80asm.Assembler import GameboyAddress
 
-def decompress_room(rom: RomData, base_address: int, room_type: int, room_info: int, group_dict: None | bytearray) -> bytearray:
-    if room_type == 1:  # Small room
-        compression_mode = room_info >> 14
-        room_pointer = base_address + room_info % 0x4000
-
-        if compression_mode == 0:
-            # That's just not compressed
-            return rom.read_bytes(room_pointer, 0x50)
-        room_data = bytearray()
-
-        while len(room_data) < 0x50:
-            # The way data is compressed is:
-            # 1- write a bit mask of len compression_mode * 8
-            # 2- write which is the most common tile in the range (skipped if mask is 0)
-            # 3- write the actual value for every 0 in the mask, 1 being the step 2 tile instead
-
-            if compression_mode == 1:
-                mask = rom.read_byte(room_pointer)
-                room_pointer += 1
+SMALL_ROOM_SIZE = 0x50
+# Longest compressed small room: 4 chunks of mode 3, each having a 2 bytes mask, a common byte and 24 literals
+SMALL_ROOM_MAX_SOURCE = 4 * (2 + 1 + 24)
+
+# For every 8 bits of a small room mask, and every number of literal bytes used by the previous bits of the chunk, where
+# each of the 8 tiles is taken from: 0 for the common byte, otherwise 1 + the index of the literal byte
+_SMALL_ROOM_GATHER = tuple(
+    tuple(bytes(0 if mask & (1 << i) else 1 + previous_literals + i - bin(mask & ((1 << i) - 1)).count("1")
+                for i in range(8))
+          for mask in range(0x100))
+    for previous_literals in range(17)
+)
+_LITERAL_COUNTS = tuple(8 - bin(mask).count("1") for mask in range(0x100))
+
+# Gather indexes and number of literal bytes of whole chunks, by compression mode and mask, built when first used
+_small_room_chunks: dict[tuple[int, int], tuple[bytes, int]] = {}
+
+
+def _small_room_chunk(compression_mode: int, mask: int) -> tuple[bytes, int]:
+    indexes = []
+    literal_count = 0
+    # Mode 3 only has a 16 bits mask, its last 8 tiles always being literals
+    for shift in range(0, 8 * compression_mode, 8):
+        mask_byte = (mask >> shift) & 0xff
+        indexes.append(_SMALL_ROOM_GATHER[literal_count][mask_byte])
+        literal_count += _LITERAL_COUNTS[mask_byte]
+    chunk = _small_room_chunks[compression_mode, mask] = (b"".join(indexes), literal_count)
+    return chunk
+
+
+def _decompress_small_room(data: memoryview, compression_mode: int) -> bytearray:
+    """
+    Decompresses a small room from a view starting at its data.
+    The way data is compressed is, for each chunk of compression_mode * 8 tiles:
+    1- write a bit mask of len compression_mode * 8
+    2- write which is the most common tile in the range (skipped if mask is 0)
+    3- write the actual value for every 0 in the mask, 1 being the step 2 tile instead
+    Tiles of a chunk are gathered at once, by translating its gather indexes with its common byte and literal bytes.
+    """
+    room_data = bytearray()
+    position = 0
+    while len(room_data) < SMALL_ROOM_SIZE:
+        if compression_mode == 1:
+            mask = data[position]
+            position += 1
+        else:
+            mask = data[position] | (data[position + 1] << 8)
+            position += 2
+
+        indexes, literal_count = _small_room_chunks.get((compression_mode, mask)) \
+            or _small_room_chunk(compression_mode, mask)
+        if mask == 0:
+            room_data += data[position:position + literal_count]
+            position += literal_count
+        else:
+            end = position + 1 + literal_count
+            room_data += indexes.translate(data[position:end].tobytes().ljust(0x100, b"\0"))
+            position = end
+    return room_data
+
+
+BIG_ROOM_SIZE = 0xb0
+BIG_ROOM_DICT_SIZE = 0x1000
+
+def _big_room_runs(mask: int) -> tuple[int, ...]:
+    """
+    The 8 items of a big room mask byte in order: the length of a run of literal bytes, or 0 for a 2 bytes dict access.
+    """
+    runs = []
+    for i in range(8):
+        if mask & (1 << i):
+            runs.append(0)
+        elif runs and runs[-1] != 0:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+    return tuple(runs)
+
+
+_BIG_ROOM_RUNS = tuple(_big_room_runs(mask) for mask in range(0x100))
+
+
+def _decompress_big_room(data: memoryview, position: int, group_dict: memoryview) -> bytearray:
+    """
+    Decompresses a big room from a view of the ROM. Using a mask again, for each of its bits:
+    0 = literal byte
+    1 = 2 bytes dict access, 12 bits of position in the dict and 4 bits of length - 3 (max is 18, used in vanilla)
+    Every item of the last mask is decoded even past the end of the room, which is truncated after.
+    """
+    room_data = bytearray()
+    while len(room_data) < BIG_ROOM_SIZE:
+        mask = data[position]
+        position += 1
+        for run in _BIG_ROOM_RUNS[mask]:
+            if run:
+                room_data += data[position:position + run]
+                position += run
             else:
-                mask = rom.read_word(room_pointer)
-                room_pointer += 2
-
-            common_byte = -1
-            if mask != 0:
-                common_byte = rom.read_byte(room_pointer)
-                room_pointer += 1
-
-            # mask:
-            # 0 = literal byte
-            # 1 = common byte
-            for i in range(8 * compression_mode):
-                if mask & (1 << i):
-                    # Apply the common byte
-                    room_data.append(common_byte)
-                else:
-                    room_data.append(rom.read_byte(room_pointer))
-                    room_pointer += 1
-        return room_data
-    else:  # Large room, with dict compression
-        room_pointer = base_address + room_info - 0x200  # I would like to know why that -200 exists
-        room_data = bytearray()
-        while len(room_data) < 0xb0:
-            # Using a mask again:
-            # 0 = literal byte
-            # 1 = 2 bytes dict access
-            mask = rom.read_byte(room_pointer)
-            room_pointer += 1
-
-            for i in range(8):
-                if mask & (1 << i):
-                    data = rom.read_word(room_pointer)
-                    room_pointer += 2
-                    data_pointer = data % 0x1000
-                    data_length = (data >> 12) + 3 # Max is 18, used in vanilla
-                    room_data.extend(group_dict[data_pointer:data_pointer + data_length])
+                reference = data[position] | (data[position + 1] << 8)
+                position += 2
+                dict_start = reference & 0xfff
+                room_data += group_dict[dict_start:dict_start + (reference >> 12) + 3]
+    del room_data[BIG_ROOM_SIZE:]
+    return room_data
+
+
+def decompress_room(rom: RomData,
+                    base_address: int,
+                    room_type: int,
+                    room_info: int,
+                    group_dict: None | bytes | bytearray | memoryview) -> bytearray:
+    with memoryview(rom.file) as view:
+        if room_type == 1:  # Small room
+            compression_mode = room_info >> 14
+            room_pointer = base_address + room_info % 0x4000
+
+            if compression_mode == 0:
+                # That's just not compressed
+                return rom.read_bytes(room_pointer, SMALL_ROOM_SIZE)
+            return _decompress_small_room(view[room_pointer:room_pointer + SMALL_ROOM_MAX_SOURCE], compression_mode)
+        else:  # Large room, with dict compression
+            room_pointer = base_address + room_info - 0x200  # I would like to know why that -200 exists
+            with memoryview(group_dict) as dict_view:
+                return _decompress_big_room(view, room_pointer, dict_view)
+
+
+def decompress_room_group(rom: RomData, room_type: int, table_address: int, base_address: int) -> list[bytearray]:
+    """
+    Decompresses the 0x100 rooms of a group at once.
+
+    Parameters:
+        rom (RomData): The ROM to read rooms from.
+        room_type (int): 1 for small rooms, otherwise big rooms.
+        table_address (int): The address of the room infos of the group, preceded by its dict for big rooms.
+        base_address (int): The address of the compressed data of the group.
+
+    Returns:
+        list[bytearray]: The tiles of every room of the group.
+    """
+    rooms = []
+    with memoryview(rom.file) as view:
+        if room_type == 1:
+            for room_info in ROOM_INFO_TABLE.bind(rom, table_address).column("room_info"):
+                compression_mode = room_info >> 14
+                room_pointer = base_address + room_info % 0x4000
+                if compression_mode == 0:
+                    rooms.append(bytearray(view[room_pointer:room_pointer + SMALL_ROOM_SIZE]))
                 else:
-                    room_data.append(rom.read_byte(room_pointer))
-                    room_pointer += 1
-        room_data = room_data[:0xb0]
-        return room_data
+                    rooms.append(_decompress_small_room(view[room_pointer:room_pointer + SMALL_ROOM_MAX_SOURCE],
+                                                        compression_mode))
+        else:
+            group_dict = view[table_address:table_address + BIG_ROOM_DICT_SIZE]
+            for room_info in ROOM_INFO_TABLE.bind(rom, table_address + BIG_ROOM_DICT_SIZE).column("room_info"):
+                rooms.append(_decompress_big_room(view, base_address + room_info - 0x200, group_dict))
+            group_dict.release()
+    return rooms
 
 
 def decompress_rooms(rom: RomData, seasons: bool = True) -> list[bytearray]:
@@ -73,31 +169,16 @@ def decompress_rooms(rom: RomData, seasons: bool = True) -> list[bytearray]:
         num_groups = 6
 
     room_data = []
-    for group in range(num_groups):
-        current_address = room_layout_group_table + group * 8
-        room_type = rom.read_byte(current_address)
-        table_address = GameboyAddress(
-            rom.read_byte(current_address + 1),
-            rom.read_word(current_address + 2)
-        ).address_in_rom()
-        base_address = GameboyAddress(
-            rom.read_byte(current_address + 4),
-            rom.read_word(current_address + 5)
-        ).address_in_rom()
-
-        group_dict = None
-        if room_type != 1:
-            group_dict = rom.read_bytes(table_address, 0x1000)
-            table_address += 0x1000
-            if __debug__ and False:
-                # Output the dict to see how it looks like
-                import os
-                from ..Util import simple_hex
-                file = open(os.path.join("output", simple_hex(group, 2) + ".bin"), "wb")
-                file.write(group_dict)
-
-        for room in range(0x100):
-            room_info = rom.read_word(table_address + room * 2)
-
-            room_data.append(decompress_room(rom, base_address, room_type, room_info, group_dict))
+    group_table = ROOM_LAYOUT_GROUP_TABLE.bind(rom, room_layout_group_table, num_groups)
+    table_addresses = group_table.resolve_column("table_offset")
+    base_addresses = group_table.resolve_column("data_offset")
+    for group, room_type in enumerate(group_table.column("room_type")):
+        if __debug__ and False and room_type != 1:
+            # Output the dict to see how it looks like
+            import os
+            from ..Util import simple_hex
+            file = open(os.path.join("output", simple_hex(group, 2) + ".bin"), "wb")
+            file.write(rom.read_bytes(table_addresses[group], BIG_ROOM_DICT_SIZE))
+
+        room_data.extend(decompress_room_group(rom, room_type, table_addresses[group], base_addresses[group]))
     return room_data
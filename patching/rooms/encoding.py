@@ -1,10 +1,13 @@
 import heapq
 import logging
 import os
+from bisect import bisect_left
 from collections import Counter, defaultdict
+from functools import lru_cache
 from importlib.resources import files
 
 from .. import rooms
+from . import ROOM_LAYOUT_GROUP_TABLE
 from ..RomData import RomData
 from ..Util import simple_hex
 from ..z80asm.Assembler import GameboyAddress
@@ -45,36 +48,194 @@ def encode_group_data_small(room_data: list[bytearray], first_room: int) -> tupl
     return 1, room_infos, group_data
 
 
-def compress_big_room(room: bytearray, compression_dict: bytes) -> bytearray:
+BIG_ROOM_SIZE = 0xb0
+MIN_REFERENCE_LENGTH = 3
+MAX_REFERENCE_LENGTH = 18
+# Cost in bits of a literal byte and of a dict access, each also taking a bit of a mask byte
+LITERAL_COST = 9
+REFERENCE_COST = 17
+
+
+class CompressionDictIndex:
+    """
+    The suffixes of a compression dict, sorted and cut to MAX_REFERENCE_LENGTH bytes, to find the longest match of
+    some data in the dict with a binary search instead of scanning it once per length.
+    """
+
+    def __init__(self, compression_dict: bytes) -> None:
+        self.compression_dict = bytes(compression_dict)
+        self.suffixes = sorted(self.compression_dict[i:i + MAX_REFERENCE_LENGTH]
+                               for i in range(len(self.compression_dict)))
+        self._substrings: None | set[bytes] = None
+
+    def longest_match_length(self, data: bytes) -> int:
+        """
+        The length of the longest prefix of data found in the dict.
+        It is the longest common prefix of data with one of the suffixes it would be sorted between.
+        """
+        index = bisect_left(self.suffixes, data)
+        longest = 0
+        for neighbour in self.suffixes[max(index - 1, 0):index + 1]:
+            length = 0
+            for data_byte, neighbour_byte in zip(data, neighbour):
+                if data_byte != neighbour_byte:
+                    break
+                length += 1
+            longest = max(longest, length)
+        return longest
+
+    def find(self, data: bytes) -> int:
+        """
+        The lowest position of data in the dict, -1 if it isn't found.
+        """
+        return self.compression_dict.find(data)
+
+    @property
+    def substrings(self) -> set[bytes]:
+        """
+        Every substring of the dict a dict access can copy, built when first needed.
+        """
+        if self._substrings is None:
+            dict_size = len(self.compression_dict)
+            self._substrings = {self.compression_dict[start:start + length]
+                                for length in range(MIN_REFERENCE_LENGTH, MAX_REFERENCE_LENGTH + 1)
+                                for start in range(dict_size - length + 1)}
+        return self._substrings
+
+
+@lru_cache(maxsize=8)
+def get_compression_dict_index(compression_dict: bytes) -> CompressionDictIndex:
+    """
+    Returns a shared index of a compression dict, so that patching several times in a process indexes each dict once.
+    """
+    return CompressionDictIndex(compression_dict)
+
+
+def _greedy_big_room_items(room: bytes, index: CompressionDictIndex) -> list[int]:
+    """
+    Always takes the longest match in the dict.
+
+    Returns:
+        list[int]: The length of every item of the room, 1 being a literal byte and more a dict access.
+    """
+    items = []
+    slice_start = 0
+    while slice_start < len(room):
+        slice_size = index.longest_match_length(room[slice_start:slice_start + MAX_REFERENCE_LENGTH])
+        if slice_size < MIN_REFERENCE_LENGTH:
+            slice_size = 1
+        items.append(slice_size)
+        slice_start += slice_size
+    return items
+
+
+def _optimal_big_room_items(room: bytes, index: CompressionDictIndex) -> list[int]:
+    """
+    Finds the items with the lowest cost through a shortest path over the positions of the room, from its end.
+    Any prefix of a match is a match too, so the longest match at a position gives every dict access possible there,
+    and the cheapest one is kept from a position to the previous one as long as they share the end of their match.
+    The cost is modelled in bits, LITERAL_COST and REFERENCE_COST each counting their mask bit, so the unused bits of
+    the last mask byte are not counted exactly. The result still never takes more bytes than the greedy one.
+
+    Returns:
+        list[int]: The length of every item of the room, 1 being a literal byte and more a dict access.
+    """
+    room_size = len(room)
+    substrings = index.substrings
+    costs = [0] * (room_size + 1)
+    lengths = [1] * room_size
+    # End of the longest match at the next position, if any, and the cheapest end of a dict access from there
+    match_end = None
+    best_cost = 0
+    best_end = 0
+    for slice_start in range(room_size - 1, -1, -1):
+        # A match minus its first byte is a match at the next position, so a match here ends at most where the one at
+        # the next position does
+        if (match_end is not None and match_end - slice_start <= MAX_REFERENCE_LENGTH
+                and room[slice_start:match_end] in substrings):
+            # Dict accesses from here can end anywhere the ones from the next position can, or 3 bytes from here
+            cost = costs[slice_start + MIN_REFERENCE_LENGTH]
+            if cost <= best_cost:
+                best_cost = cost
+                best_end = slice_start + MIN_REFERENCE_LENGTH
+        else:
+            # Conditions rather than min(), as this runs for every position without a match
+            if match_end is None:
+                slice_end = slice_start + MIN_REFERENCE_LENGTH
+            elif match_end - slice_start > MAX_REFERENCE_LENGTH:
+                slice_end = slice_start + MAX_REFERENCE_LENGTH
+            else:
+                slice_end = match_end - 1
+            if slice_end > room_size:
+                slice_end = room_size
+            shortest_end = slice_start + MIN_REFERENCE_LENGTH
+            while slice_end >= shortest_end and room[slice_start:slice_end] not in substrings:
+                slice_end -= 1
+            if slice_end >= shortest_end:
+                match_end = slice_end
+                next_costs = costs[slice_start + MIN_REFERENCE_LENGTH:slice_end + 1]
+                best_cost = min(next_costs)
+                best_end = slice_start + MIN_REFERENCE_LENGTH + next_costs.index(best_cost)
+            else:
+                match_end = None
+
+        cost = LITERAL_COST + costs[slice_start + 1]
+        if match_end is not None and REFERENCE_COST + best_cost < cost:
+            cost = REFERENCE_COST + best_cost
+            lengths[slice_start] = best_end - slice_start
+        costs[slice_start] = cost
+
+    items = []
+    slice_start = 0
+    while slice_start < room_size:
+        items.append(lengths[slice_start])
+        slice_start += lengths[slice_start]
+    return items
+
+
+def compress_big_room(room: bytearray,
+                      compression_dict: bytes,
+                      index: None | CompressionDictIndex = None,
+                      optimal: bool = False) -> bytearray:
+    """
+    Compresses a big room: for each 8 items, a mask byte then the items, a bit of the mask being set for a 2 bytes dict
+    access and unset for a literal byte.
+
+    Parameters:
+        room (bytearray): The tiles of the room.
+        compression_dict (bytes): The compression dict of the group of the room.
+        index (None | CompressionDictIndex): The index of the dict, built if not given.
+        optimal (bool): Picks the items taking the least space instead of always taking the longest match.
+
+    Returns:
+        bytearray: The compressed room.
+    """
+    if index is None:
+        index = CompressionDictIndex(compression_dict)
+    room = bytes(room)
+    if optimal:
+        items = _optimal_big_room_items(room, index)
+    else:
+        items = _greedy_big_room_items(room, index)
+
     room_data = bytearray()
-    mask_data = bytearray()
     slice_start = 0
-    mask = 0
-    mask_length = 0
-    while slice_start < 0xb0:
-        if mask_length == 8:
-            room_data.append(mask)
-            room_data.extend(mask_data)
-            mask_length = 0
-            mask = 0
-            mask_data.clear()
-        for slice_size in range(min(0xb0 - slice_start, 18), 2, -1):
-            pos = compression_dict.find(room[slice_start:slice_start + slice_size])
-            if pos != -1:
-                mask |= 1 << mask_length
-                slice_start += slice_size
-                mask_length += 1
+    for chunk_start in range(0, len(items), 8):
+        mask = 0
+        mask_data = bytearray()
+        for i, slice_size in enumerate(items[chunk_start:chunk_start + 8]):
+            if slice_size == 1:
+                mask_data.append(room[slice_start])
+            else:
+                # Lowest position of the match in the dict
+                pos = index.find(room[slice_start:slice_start + slice_size])
                 assert pos < 0x1000
-                data = pos + ((slice_size - 3) << 12)
+                mask |= 1 << i
+                data = pos + ((slice_size - MIN_REFERENCE_LENGTH) << 12)
                 mask_data.extend(data.to_bytes(2, "little"))
-                break
-        else:
-            mask_data.append(room[slice_start])
-            slice_start += 1
-            mask_length += 1
-
-    room_data.append(mask)
-    room_data.extend(mask_data)
+            slice_start += slice_size
+        room_data.append(mask)
+        room_data.extend(mask_data)
     # Rest is garbage, but shouldn't be read anyway
 
     return room_data
@@ -143,7 +304,10 @@ def load_compression_dict(first_room: int, seasons: bool) -> bytes | None:
     return None
 
 
-def encode_group_data_big(room_data: list[bytearray], first_room: int, seasons: bool) -> tuple[int, bytearray, bytearray]:
+def encode_group_data_big(room_data: list[bytearray],
+                          first_room: int,
+                          seasons: bool,
+                          optimal: bool = False) -> tuple[int, bytearray, bytearray]:
     compression_dict = load_compression_dict(first_room, seasons)
     if not compression_dict:
         logging.warning("No compression dict found in the apworld, generating one, it will take some time...")
@@ -161,24 +325,38 @@ def encode_group_data_big(room_data: list[bytearray], first_room: int, seasons:
     room_infos = bytearray()
     room_infos.extend(compression_dict)
     group_data = bytearray()
+    index = get_compression_dict_index(bytes(compression_dict))
 
     for room_id in range(first_room, first_room + 0x100):
         room_info = len(group_data) + 0x200
         room_infos.extend(room_info.to_bytes(2, "little"))
-        compressed_room = compress_big_room(room_data[room_id], compression_dict)
+        compressed_room = compress_big_room(room_data[room_id], compression_dict, index, optimal)
         group_data.extend(compressed_room)
     return 0, room_infos, group_data
 
 
-def encode_group_data(room_data: list[bytearray], group: int, seasons: bool) -> tuple[int, bytearray, bytearray]:
+def encode_group_data(room_data: list[bytearray],
+                      group: int,
+                      seasons: bool,
+                      optimal: bool = False) -> tuple[int, bytearray, bytearray]:
     first_room = group * 0x100
     if len(room_data[first_room]) == 0x50:
         return encode_group_data_small(room_data, first_room)
     else:
-        return encode_group_data_big(room_data, first_room, seasons)
+        return encode_group_data_big(room_data, first_room, seasons, optimal)
+
 
+def write_room_data(rom: RomData, room_data: list[bytearray], seasons: bool, optimal_compression: bool = False):
+    """
+    Compresses rooms and writes them to the ROM, along with the tables pointing to them.
 
-def write_room_data(rom: RomData, room_data: list[bytearray], seasons: bool):
+    Parameters:
+        rom (RomData): The ROM to write rooms to.
+        room_data (list[bytearray]): The tiles of every room.
+        seasons (bool): Writes the rooms of seasons if true, otherwise ages.
+        optimal_compression (bool): Compresses big rooms into the least space possible instead of always taking the
+            longest match in the dict, leaving more room for edited rooms at the cost of a different output.
+    """
     if seasons:
         room_layout_group_table = GameboyAddress(0x04, 0x4c4c).address_in_rom()
         small_group_layout_table = GameboyAddress(0x16, 0x7006)
@@ -195,27 +373,25 @@ def write_room_data(rom: RomData, room_data: list[bytearray], seasons: bool):
         num_groups = 6
 
     group_layout_table = small_group_layout_table
+    group_table = ROOM_LAYOUT_GROUP_TABLE.bind(rom, room_layout_group_table, num_groups)
     for group in range(num_groups):
-        current_address = room_layout_group_table + group * 8
-        room_type, room_infos, group_data = encode_group_data(room_data, group, seasons)
+        room_type, room_infos, group_data = encode_group_data(room_data, group, seasons, optimal_compression)
         if room_type == 0 and group_layout_table < big_group_layout_table:
             group_layout_table = big_group_layout_table
 
-        # Room type
-        rom.write_byte(current_address, room_type)
-
-        # Room infos address
-        rom.write_byte(current_address + 1, group_layout_table.bank)
-        rom.write_word(current_address + 2, group_layout_table.to_word_int())
+        # Room type, room infos address and group's data address
+        group_table.write(group, group_table[group]._replace(
+            room_type=room_type,
+            table_bank=group_layout_table.bank,
+            table_offset=group_layout_table.to_word_int(),
+            data_bank=room_data_current.bank,
+            data_offset=room_data_current.to_word_int(),
+        ))
 
         # Room infos content
         rom.write_bytes(group_layout_table.address_in_rom(), room_infos)
         group_layout_table += len(room_infos)
 
-        # Group's data address
-        rom.write_byte(current_address + 4, room_data_current.bank)
-        rom.write_word(current_address + 5, room_data_current.to_word_int())
-
         # Group's data content
         rom.write_bytes(room_data_current.address_in_rom(), group_data)
         room_data_current += len(group_data)
@@ -0,0 +1,291 @@
+import re
+import struct
+from array import array
+from collections import namedtuple
+from collections.abc import Iterable, Sequence
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from .z80asm.Assembler import GameboyAddress
+
+if TYPE_CHECKING:
+    from .RomData import RomData
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Pointer scheme of a field holding an offset from the base address given when binding the table
+RELATIVE = "relative"
+
+_format_item_pattern = re.compile(r"(\d*)([xcbB?hHiIlLqQefds])")
+_array_typecodes = {"b": "b", "B": "B", "?": "B", "h": "h", "H": "H", "i": "i", "I": "I", "l": "l", "L": "L",
+                    "q": "q", "Q": "Q", "e": "f", "f": "f", "d": "d"}
+
+
+class RecordTable:
+    """
+    Declarative description of a table of fixed-size records in the ROM.
+    It does not hold any data by itself, and must be bound to a location in a ROM to be read or written.
+    """
+
+    def __init__(self,
+                 name: str,
+                 fmt: str,
+                 fields: Sequence[str],
+                 count: Optional[int] = None,
+                 terminator: Optional[int] = None,
+                 pointers: Optional[dict[str, Union[int, str]]] = None) -> None:
+        """
+        Parameters:
+            name (str): The name of the table, used for the record type and error messages.
+            fmt (str): A struct format describing one record, little endian if no byte order is given.
+            fields (Sequence[str]): The name of every non-padding item of the format.
+            count (Optional[int]): The number of records, if the table always has the same size.
+            terminator (Optional[int]): The value of the first byte of the record ending the table, if any.
+            pointers (Optional[dict[str, Union[int, str]]]): How word fields resolve to an address in the ROM:
+                an int is the bank of a near pointer, a str is the name of the field holding the bank of a far pointer,
+                and RELATIVE is an offset from the base address given when binding the table.
+        """
+        self.name = name
+        self.fmt = fmt if fmt[:1] in ("<", ">", "!", "=", "@") else "<" + fmt
+        self.record = struct.Struct(self.fmt)
+        self.size = self.record.size
+        self.fields = tuple(fields)
+        self.count = count
+        self.terminator = terminator
+        self.pointers = pointers or {}
+        self.record_type = namedtuple(name, self.fields)
+
+        # Offset, format and array typecode of every field
+        self.layout: dict[str, tuple[int, str, str]] = {}
+        field_names = iter(self.fields)
+        offset = 0
+        for repeat, code in _format_item_pattern.findall(self.fmt):
+            repeat = int(repeat) if repeat else 1
+            if code == "x":
+                offset += repeat
+                continue
+            if code == "s":
+                item_formats = [f"{repeat}s"]
+            else:
+                item_formats = [code] * repeat
+            for item_format in item_formats:
+                self.layout[next(field_names)] = (offset, item_format, _array_typecodes.get(code, ""))
+                offset += struct.calcsize(self.fmt[0] + item_format)
+        assert offset == self.size and len(self.layout) == len(self.fields), f"Fields of {name} don't match its format"
+
+    def bind(self, rom: "RomData", address: int, count: Optional[int] = None, base: int = 0) -> "BoundTable":
+        """
+        Binds the table to a location in a ROM.
+
+        Parameters:
+            rom (RomData): The ROM holding the table.
+            address (int): The address of the first record.
+            count (Optional[int]): The number of records, overriding the one of the description.
+                If neither is given, records are counted up to the terminator.
+            base (int): The address RELATIVE pointer fields are offsets from.
+
+        Returns:
+            BoundTable: A view over the records of the table.
+        """
+        return BoundTable(self, rom, address, self.count if count is None else count, base)
+
+    def bind_near(self, rom: "RomData", bank: int, pointer_address: int, count: Optional[int] = None) -> "BoundTable":
+        """
+        Binds the table to the location given by a near pointer into the given bank.
+        """
+        return self.bind(rom, GameboyAddress(bank, rom.read_u16le(pointer_address)).address_in_rom(), count)
+
+    def bind_far(self, rom: "RomData", pointer_address: int, count: Optional[int] = None) -> "BoundTable":
+        """
+        Binds the table to the location given by a far pointer (bank, then word).
+        """
+        return self.bind(rom, rom.read_far_pointer(pointer_address), count)
+
+
+class BoundTable:
+    """
+    The records of a table at a given address of a given ROM.
+    Records are read in bulk when iterating or exporting columns, and lazily one by one when indexing.
+    """
+
+    def __init__(self, table: RecordTable, rom: "RomData", address: int, count: Optional[int], base: int) -> None:
+        self.table = table
+        self.rom = rom
+        self.address = address
+        self.base = base
+        self.count = self._scan_count() if count is None else count
+
+    def _scan_count(self) -> int:
+        table = self.table
+        if table.terminator is None:
+            raise ValueError(f"Table {table.name} needs either a count or a terminator")
+        file = self.rom.file
+        address = self.address
+        while file[address] != table.terminator:
+            address += table.size
+        return (address - self.address) // table.size
+
+    @property
+    def end(self) -> int:
+        """
+        The address right after the last record, terminator excluded.
+        """
+        return self.address + self.count * self.table.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def address_of(self, index: int) -> int:
+        if not 0 <= index < self.count:
+            raise IndexError(f"Record {index} is out of range for table {self.table.name}")
+        return self.address + index * self.table.size
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += self.count
+        return self.table.record_type._make(self.table.record.unpack_from(self.rom.file, self.address_of(index)))
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def raw_records(self) -> list[tuple]:
+        """
+        Reads every record in a single call, as plain tuples.
+        """
+        return self.rom.read_table(self.address, self.table.fmt, self.count)
+
+    def records(self) -> list[tuple]:
+        """
+        Reads every record in a single call, as named tuples.
+        """
+        make = self.table.record_type._make
+        return [make(values) for values in self.raw_records()]
+
+    def column(self, field: str) -> Union[array, list]:
+        """
+        Reads a single field of every record in a single call.
+        Numeric fields are returned as an array, byte string fields as a list.
+        """
+        offset, item_format, typecode = self.table.layout[field]
+        trailing = self.table.size - offset - struct.calcsize(self.table.fmt[0] + item_format)
+        column_format = f"{self.table.fmt[0]}{offset}x{item_format}{trailing}x"
+        values = [value for (value,) in self.rom.read_table(self.address, column_format, self.count)]
+        return array(typecode, values) if typecode else values
+
+    def columns(self) -> dict[str, Union[array, list]]:
+        """
+        Reads the whole table as a struct of arrays, one per field.
+        """
+        columns = {}
+        transposed = zip(*self.raw_records()) if self.count else [() for _ in self.table.fields]
+        for field, values in zip(self.table.fields, transposed):
+            typecode = self.table.layout[field][2]
+            columns[field] = array(typecode, values) if typecode else list(values)
+        return columns
+
+    def to_numpy(self) -> dict[str, Any]:
+        """
+        Exports the whole table as a struct of NumPy arrays, one per field, without creating Python objects.
+
+        Raises:
+            ImportError: NumPy is not installed.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required to export ROM tables as NumPy arrays")
+        byte_order = ">" if self.table.fmt[0] in (">", "!") else "<"
+        formats = []
+        for field in self.table.fields:
+            _, item_format, typecode = self.table.layout[field]
+            size = struct.calcsize(self.table.fmt[0] + item_format)
+            if not typecode:
+                formats.append(f"S{size}")
+            else:
+                kind = "f" if typecode in ("f", "d") else ("i" if typecode.islower() else "u")
+                formats.append(f"{byte_order}{kind}{size}")
+        dtype = numpy.dtype({
+            "names": list(self.table.fields),
+            "formats": formats,
+            "offsets": [self.table.layout[field][0] for field in self.table.fields],
+            "itemsize": self.table.size,
+        })
+        records = numpy.frombuffer(self.rom.file, dtype=dtype, count=self.count, offset=self.address)
+        return {field: records[field].copy() for field in self.table.fields}
+
+    def resolve(self, index: int, field: str) -> int:
+        """
+        Resolves a pointer field of a record to an address in the ROM, following the pointer scheme of the table.
+        """
+        record = self[index]
+        scheme = self.table.pointers[field]
+        if scheme == RELATIVE:
+            return self.base + getattr(record, field)
+        if isinstance(scheme, str):
+            return GameboyAddress(getattr(record, scheme), getattr(record, field)).address_in_rom()
+        return GameboyAddress(scheme, getattr(record, field)).address_in_rom()
+
+    def resolve_column(self, field: str) -> list[int]:
+        """
+        Resolves a pointer field of every record to an address in the ROM in a single pass.
+        """
+        scheme = self.table.pointers[field]
+        if scheme == RELATIVE:
+            base = self.base
+            return [base + value for value in self.column(field)]
+        if isinstance(scheme, str):
+            return [GameboyAddress(bank, value).address_in_rom()
+                    for bank, value in zip(self.column(scheme), self.column(field))]
+        return [GameboyAddress(scheme, value).address_in_rom() for value in self.column(field)]
+
+    def write(self, index: int, values: Iterable) -> None:
+        """
+        Writes a single record.
+        """
+        self.rom.write_table(self.address_of(index), self.table.fmt, [tuple(values)])
+
+    def write_all(self, records: Sequence[Iterable]) -> int:
+        """
+        Writes every record of the table (and the terminator, if any) in a single pass.
+        The table is resized to the number of given records.
+
+        Returns:
+            int: The address right after the written data.
+        """
+        self.count = len(records)
+        end = self.rom.write_table(self.address, self.table.fmt, records)
+        if self.table.terminator is not None:
+            self.rom.write_byte(end, self.table.terminator)
+            end += 1
+        return end
+
+    def build_index(self, *key_fields: str) -> tuple[dict[Any, int], list[tuple[int, int, int, int]]]:
+        """
+        Maps the values of the given fields to the index of the first record holding them, in a single pass.
+
+        Returns:
+            tuple: The map, and the spans of the ROM it depends on, as expected by RomData.get_index.
+        """
+        positions = [self.table.fields.index(field) for field in key_fields]
+        index = {}
+        if len(positions) == 1:
+            position = positions[0]
+            for i, record in enumerate(self.raw_records()):
+                index.setdefault(record[position], i)
+        else:
+            for i, record in enumerate(self.raw_records()):
+                index.setdefault(tuple(record[position] for position in positions), i)
+
+        width = 1 if self.table.terminator is not None else 0
+        for field in key_fields:
+            offset, item_format, _ = self.table.layout[field]
+            width = max(width, offset + struct.calcsize(self.table.fmt[0] + item_format))
+        span_end = self.end + (1 if self.table.terminator is not None else 0)
+        return index, [(self.address, span_end, self.table.size, width)]
+
+    def index(self, *key_fields: str) -> dict[Any, int]:
+        """
+        Same as build_index, but cached on the ROM until a write touches the key fields or the terminator.
+        """
+        key = ("table", self.table.name, self.address, self.count, key_fields)
+        return self.rom.get_index(key, lambda: self.build_index(*key_fields))
@@ -1,3 +1,7 @@
+from functools import lru_cache
+
+from .tokens import control_pattern
+from ..tables import RELATIVE, RecordTable
 from ..z80asm.Assembler import GameboyAddress
 
 # 🚫 means it's a command character
@@ -27,6 +31,9 @@ kanji_table = ("姫村下木東西南北地図出入口水氷池"
 
 text_colors = set("🟥🟩🟦⬜")
 
+# Offsets of the text table: category offsets are relative to the text table, text offsets to their text bank
+TEXT_OFFSET_TABLE = RecordTable("TextOffset", "H", ("offset",), pointers={"offset": RELATIVE})
+
 text_table_eng_seasons = GameboyAddress(0x1c, 0x5c00)
 text_table_eng_address_seasons = text_table_eng_seasons.address_in_rom()
 
@@ -53,23 +60,78 @@ text_offset_split_index_ages = 0x2c
 text_addresses_limit_ages = GameboyAddress(0x23, 0x4e04).address_in_rom()
 
 
+# Width of a line of text in tiles
+TEXT_LINE_WIDTH = 16
+# Width of what control sequences are replaced with in game, the other ones not being shown
+control_sequence_widths = {"\\link_name": 5, "\\child_name": 5, "\\num1": 3, "\\num2": 3}
+# Removes the glyphs which take no space, so that the width of plain text is its length
+_remove_zero_width = str.maketrans("", "", "".join(text_colors))
+
+
+def _word_tokens(word: str) -> list[tuple[str, int]]:
+    """
+    Splits a word into its characters and control sequences, along with their width.
+    """
+    tokens = []
+    position = 0
+    for match in control_pattern.finditer(word):
+        tokens.extend((char, 0 if char in text_colors else 1) for char in word[position:match.start()])
+        sequence = match.group()
+        if match.group(1) is None and match.group(3) is None:
+            # Not a control sequence, just a backslash
+            tokens.append((sequence, 1))
+        else:
+            tokens.append((sequence, control_sequence_widths.get(sequence, 0)))
+        position = match.end()
+    tokens.extend((char, 0 if char in text_colors else 1) for char in word[position:])
+    return tokens
+
+
+def _word_width(word: str) -> int:
+    if "\\" not in word:
+        return len(word.translate(_remove_zero_width))
+    return sum(width for _, width in _word_tokens(word))
+
+
+def _truncate_word(word: str) -> str:
+    """
+    Cuts a word too wide for a line, ending it with a dot and keeping the control sequences of the part cut.
+    """
+    kept = []
+    width = 0
+    for token, token_width in _word_tokens(word):
+        if token_width == 0 or width + token_width < TEXT_LINE_WIDTH:
+            kept.append(token)
+            width += token_width
+        elif width < TEXT_LINE_WIDTH:
+            kept.append(".")
+            width = TEXT_LINE_WIDTH
+    return "".join(kept)
+
+
+@lru_cache(maxsize=0x2000)
 def normalize_text(text: str) -> str:
-    normalized_text = ""
-    current_line = 0
-    words = text.split(" ")
-    for word in words:
-        word_length = sum(1 for c in word if c not in text_colors)
-        if "\\link_name" in word:
-            word_length -= 5
-        if word_length > 16:
-            word = f"{word[:15]}.{''.join([c for c in word[15:] if c in text_colors])}"
-            pass
-        if current_line != 0 and current_line + word_length < 16:
-            normalized_text += " "
-            current_line += 1
-        elif current_line != 0:
-            normalized_text += "\n"
-            current_line = 0
-        normalized_text += word
-        current_line += len(word)
-    return normalized_text
+    """
+    Wraps a text on lines of TEXT_LINE_WIDTH tiles, words being separated by a space or a line break.
+    Words too wide for a single line are truncated.
+    """
+    parts = []
+    line_width = 0
+    # Whether the line holds a word already, which may take no width, such as a color
+    line_started = False
+    for word in text.split(" "):
+        word_width = _word_width(word)
+        if word_width > TEXT_LINE_WIDTH:
+            word = _truncate_word(word)
+            word_width = TEXT_LINE_WIDTH
+        if line_started and line_width + word_width < TEXT_LINE_WIDTH:
+            parts.append(" ")
+            line_width += 1
+        elif line_started:
+            parts.append("\n")
+            line_width = 0
+            line_started = False
+        parts.append(word)
+        line_width += word_width
+        line_started = line_started or word != ""
+    return "".join(parts)
@@ -0,0 +1,93 @@
+import hashlib
+import struct
+from pathlib import Path
+from typing import Optional
+
+from ..Util import write_file_atomically
+
+# File layout: header, then for each entry its key, the length of its encoding and the encoding itself
+CACHE_MAGIC = b"OOTC"
+CACHE_FORMAT_VERSION = 1
+CACHE_HEADER = struct.Struct("<4sHI")
+CACHE_ENTRY_HEADER = struct.Struct("<16sH")
+
+
+def text_cache_key(text: str, encoder_version: bytes) -> bytes:
+    """
+    Content-addressed key of an encoded text: a hash of the text and of the version of everything its encoding
+    depends on (encoding table, dictionary and encoder).
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16, key=encoder_version[:64]).digest()
+
+
+class EncodedTextCache:
+    """
+    Maps hashes of texts to their encoding, persisted in a compact binary file so that texts which didn't change since
+    a previous patch are not encoded again.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = 0x4000) -> None:
+        """
+        Parameters:
+            path (Optional[Path]): The file the cache is loaded from and saved to. If None, it only lives in memory.
+            max_entries (int): The number of entries kept when saving, the ones used since loading being kept first.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: dict[bytes, bytes] = {}
+        self.used: set[bytes] = set()
+        self.dirty = False
+        if path is not None and path.is_file():
+            self._load(path.read_bytes())
+
+    def _load(self, data: bytes) -> None:
+        if len(data) < CACHE_HEADER.size:
+            return
+        magic, version, count = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != CACHE_FORMAT_VERSION:
+            # Stale or foreign file, it will be overwritten on next save
+            return
+        entries = {}
+        offset = CACHE_HEADER.size
+        try:
+            for _ in range(count):
+                key, length = CACHE_ENTRY_HEADER.unpack_from(data, offset)
+                offset += CACHE_ENTRY_HEADER.size
+                if offset + length > len(data):
+                    return
+                entries[key] = data[offset:offset + length]
+                offset += length
+        except struct.error:
+            return
+        self.entries = entries
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        encoded = self.entries.get(key)
+        if encoded is not None:
+            self.used.add(key)
+        return encoded
+
+    def put(self, key: bytes, encoded: bytes) -> None:
+        self.entries[key] = encoded
+        self.used.add(key)
+        self.dirty = True
+
+    def save(self) -> None:
+        """
+        Writes the cache to its file, through a temporary file so that a concurrent reader never sees a partial file.
+        """
+        if self.path is None or not self.dirty:
+            return
+        kept_keys = [key for key in self.entries if key in self.used]
+        kept_keys.extend(key for key in self.entries if key not in self.used)
+        del kept_keys[self.max_entries:]
+
+        chunks = [CACHE_HEADER.pack(CACHE_MAGIC, CACHE_FORMAT_VERSION, len(kept_keys))]
+        for key in kept_keys:
+            encoded = self.entries[key]
+            chunks.append(CACHE_ENTRY_HEADER.pack(key, len(encoded)))
+            chunks.append(encoded)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomically(self.path, b"".join(chunks))
+        self.dirty = False
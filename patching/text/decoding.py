@@ -1,165 +1,188 @@
 from typing import Optional
 
 from ..RomData import RomData
-from . import char_table, kanji_table, text_offset_1_table_address_seasons, text_offset_2_table_address_seasons, text_table_eng_address_seasons, \
+from . import TEXT_OFFSET_TABLE, char_table, kanji_table, text_offset_1_table_address_seasons, text_offset_2_table_address_seasons, text_table_eng_address_seasons, \
     text_offset_split_index_seasons, text_offset_1_table_address_ages, text_offset_2_table_address_ages, text_table_eng_address_ages, \
     text_offset_split_index_ages
 from ..Util import simple_hex
-from ..z80asm.Assembler import GameboyAddress
 
 
 def parse_text_dict(rom: RomData, seasons: bool):
     if seasons:
         base_address = text_table_eng_address_seasons
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_seasons), rom.read_word(text_offset_1_table_address_seasons + 1))
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_seasons)
     else:
         base_address = text_table_eng_address_ages
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_ages), rom.read_word(text_offset_1_table_address_ages + 1))
-    dict_entries_offset = rom.read_word(base_address)
-
-    base_address += dict_entries_offset
-    text_offset_1_address = text_offset_1.address_in_rom()
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_ages)
+    dict_entries_offset = rom.read_u16le(base_address)
 
+    entries = TEXT_OFFSET_TABLE.bind(rom, base_address + dict_entries_offset, 0x400, base=text_offset_1_address)
     text_dict = {}
-    for i in range(0x400):
-        entry_address = text_offset_1_address + rom.read_word(base_address)
-        base_address += 2
-
-        text_dict[f"DICT{i // 0x100}_{simple_hex(i % 0x100)}"] = decode_text(rom, entry_address)
+    with memoryview(rom.file) as view:
+        for i, entry_address in enumerate(entries.resolve_column("offset")):
+            text_dict[f"DICT{i // 0x100}_{simple_hex(i % 0x100)}"] = _decode_text(view, entry_address, None)
 
     return text_dict
 
 
-def parse_all_texts(rom: RomData, dictionary: dict[str, str], seasons: bool):
+def read_text_addresses(rom: RomData, seasons: bool) -> dict[str, int]:
+    """
+    Reads the address of every text from the offset tables, without decoding anything.
+    """
     if seasons:
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_seasons), rom.read_word(text_offset_1_table_address_seasons + 1))
-        text_offset_2 = GameboyAddress(rom.read_byte(text_offset_2_table_address_seasons), rom.read_word(text_offset_2_table_address_seasons + 1))
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_seasons)
+        text_offset_2_address = rom.read_far_pointer(text_offset_2_table_address_seasons)
         base_address = text_table_eng_address_seasons
         text_offset_split_index = text_offset_split_index_seasons
     else:
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_ages), rom.read_word(text_offset_1_table_address_ages + 1))
-        text_offset_2 = GameboyAddress(rom.read_byte(text_offset_2_table_address_ages), rom.read_word(text_offset_2_table_address_ages + 1))
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_ages)
+        text_offset_2_address = rom.read_far_pointer(text_offset_2_table_address_ages)
         base_address = text_table_eng_address_ages
         text_offset_split_index = text_offset_split_index_ages
 
-    text_offset_1_address = text_offset_1.address_in_rom()
-    text_offset_2_address = text_offset_2.address_in_rom()
-    current_offset_address = base_address + 8
-    prev_offset = rom.read_word(current_offset_address)
-    current_offset_address += 2
+    # Category offsets for indices 4 to 0x5f, the end of the last one being the start of the text data
+    category_offsets = TEXT_OFFSET_TABLE.bind(rom, base_address + 8, 0x5c).column("offset").tolist()
+    category_offsets.append(text_offset_1_address - base_address)
+
+    text_addresses = {}
+    prev_offset = category_offsets[0]
     prev_index = 4
-    texts_season = {}
     for i in range(5, 0x61):
-        if i == 0x60:
-            offset = text_offset_1_address - base_address
-        else:
-            offset = rom.read_word(current_offset_address)
-            current_offset_address += 2
+        offset = category_offsets[i - 4]
         if offset <= prev_offset:
             continue
         if prev_index < text_offset_split_index:
             base_text_offset = text_offset_1_address
         else:
             base_text_offset = text_offset_2_address
-        for j in range(0, (offset - prev_offset) // 2):
-            text_offset = rom.read_word(base_address + prev_offset + j * 2)
-            texts_season[f"TX_{simple_hex(prev_index - 4)}{simple_hex(j)}"] = (
-                decode_text(rom, base_text_offset + text_offset, dictionary))
+        text_offsets = TEXT_OFFSET_TABLE.bind(rom, base_address + prev_offset, (offset - prev_offset) // 2, base=base_text_offset)
+        for j, text_address in enumerate(text_offsets.resolve_column("offset")):
+            text_addresses[f"TX_{simple_hex(prev_index - 4)}{simple_hex(j)}"] = text_address
         prev_offset = offset
         prev_index = i
+    return text_addresses
+
+
+def parse_all_texts(rom: RomData, dictionary: dict[str, str], seasons: bool):
+    # Every text is decoded over a single view of the ROM, texts sharing the same address being decoded once
+    decoded = {}
+    texts_season = {}
+    with memoryview(rom.file) as view:
+        for key, text_address in read_text_addresses(rom, seasons).items():
+            text = decoded.get(text_address)
+            if text is None:
+                text = decoded[text_address] = _decode_text(view, text_address, dictionary)
+            texts_season[key] = text
     return texts_season
 
 
+def _build_two_byte_codes() -> dict[int, tuple[Optional[str], ...]]:
+    """
+    Text of every control code followed by an argument byte, for every argument.
+    None marks an invalid argument, and the jump code is handled by the decoder as it ends the text.
+    """
+    codes = {
+        0x06: tuple(kanji_table[i] if i < len(kanji_table) else None for i in range(0x100)),
+        0x07: tuple(f"\\jump({simple_hex(i)})" for i in range(0x100)),
+        0x08: tuple(f"\\cmd({simple_hex(i)})" for i in range(0x100)),
+        0x09: ("⬜", "🟥", "🟧", "🟦", "🟩") + tuple(f"\\col({simple_hex(i)})" for i in range(5, 0x100)),
+        0x0a: ("\\link_name", "\\child_name", "\\w7SecretBuffer1", "\\w7SecretBuffer2") + ("",) * 0xfc,
+        0x0b: tuple(f"\\charsfx({simple_hex(i)})" for i in range(0x100)),
+        0x0d: tuple(f"\\wait({simple_hex(i)})" for i in range(0x100)),
+        0x0e: tuple(f"\\sfx({simple_hex(i)})" for i in range(0x100)),
+        0x0f: tuple(f"\\call({simple_hex(i)})" for i in range(0x100)),
+        # Two parts A and B buttons
+        0xb8: tuple("Ⓐ" if i == 0xb9 else None for i in range(0x100)),
+        0xba: tuple("Ⓑ" if i == 0xbb else None for i in range(0x100)),
+        # Second parts of the buttons on their own do nothing
+        0xb9: ("",) * 0x100,
+        0xbb: ("",) * 0x100,
+    }
+    commands = (None, "\\num1", "\\opt", "\\stop", None, "\\heartpiece", "\\num2", "\\slow")
+    speed_commands = []
+    for i in range(0x100):
+        command = i >> 3
+        if command == 0:
+            speed_commands.append(f"\\speed({simple_hex(i & 3)})")
+        elif command == 4:
+            speed_commands.append(f"\\pos({simple_hex(i & 3)})")
+        elif command < len(commands):
+            speed_commands.append(commands[command])
+        else:
+            speed_commands.append("")
+    codes[0x0c] = tuple(speed_commands)
+    return codes
+
+
+# Opcodes are dispatched through these tables: plain characters map to their text, dictionary codes to the key of
+# their entry, and other control codes to the text of each of their arguments
+_literals = tuple(char_table[i] if i < len(char_table) and char_table[i] != "🚫" else None for i in range(0x100))
+_dictionary_keys = {code: tuple(f"DICT{code - 2}_{simple_hex(i)}" for i in range(0x100)) for code in range(0x02, 0x06)}
+_two_byte_codes = _build_two_byte_codes()
+
+
 def decode_text(rom: RomData, entry_address: int, dictionary: Optional[dict[str, str]] = None) -> str:
-    text = ""
+    with memoryview(rom.file) as view:
+        return _decode_text(view, entry_address, dictionary)
+
+
+def _decode_text(view: memoryview, address: int, dictionary: Optional[dict[str, str]]) -> str:
+    """
+    Decodes the text at the given address, every opcode being looked up in the opcode tables and the pieces joined once
+    at the end.
+    """
+    pieces = []
+    append = pieces.append
+    literals = _literals
     while True:
-        character = rom.read_byte(entry_address)
-        entry_address += 1
-        converted = char_table[character]
-        if converted != "🚫":
-            text += converted
+        opcode = view[address]
+        piece = literals[opcode]
+        if piece is not None:
+            append(piece)
+            address += 1
+            continue
+        if opcode == 0x00:
+            break
+        argument = view[address + 1]
+        if opcode < 0x06:
+            append(dictionary[_dictionary_keys[opcode][argument]])
         else:
-            if character == 0x00:
+            arguments = _two_byte_codes.get(opcode)
+            if arguments is None:
+                raise IndexError(f"Unknown text opcode {simple_hex(opcode)} at {hex(address)}")
+            piece = arguments[argument]
+            if piece is None:
+                if opcode == 0x06:
+                    raise IndexError(f"Unknown kanji {simple_hex(argument)} at {hex(address)}")
+                raise AssertionError(f"Invalid second part {simple_hex(argument)} of button {simple_hex(opcode)} at {hex(address)}")
+            append(piece)
+            if opcode == 0x07:
                 break
-            character2 = rom.read_byte(entry_address)
-            entry_address += 1
-            if character < 0x06:
-                text += dictionary[f"DICT{character - 2}_{simple_hex(character2)}"]
-            elif character == 0x06:
-                text += kanji_table[character2]  # Only the music note, triforce icon and trade items are used in EN in the kanji part
-            elif character == 0x07:
-                text += f"\\jump({simple_hex(character2)})"
-                break
-            elif character == 0x08:
-                text += f"\\cmd({simple_hex(character2)})"
-            elif character == 0x09:
-                if character2 == 0:
-                    text += "⬜"
-                elif character2 == 1:
-                    text += "🟥"
-                elif character2 == 2:
-                    text += "🟧"
-                elif character2 == 3:
-                    text += "🟦"
-                elif character2 == 4:
-                    text += "🟩"
-                else:
-                    text += f"\\col({simple_hex(character2)})"
-            elif character == 0x0a:
-                if character2 == 0:
-                    text += "\\link_name"
-                elif character2 == 1:
-                    text += "\\child_name"
-                elif character2 == 2:
-                    text += "\\w7SecretBuffer1"
-                elif character2 == 3:
-                    text += "\\w7SecretBuffer2"
-            elif character == 0x0b:
-                text += f"\\charsfx({simple_hex(character2)})"
-            elif character == 0x0c:
-                argument = character2 & 3
-                command = character2 >> 3
-                if command == 0:
-                    text += f"\\speed({simple_hex(argument)})"
-                elif command == 1:
-                    text += "\\num1"
-                elif command == 2:
-                    text += "\\opt"
-                elif command == 3:
-                    text += "\\stop"
-                elif command == 4:
-                    text += f"\\pos({simple_hex(argument)})"
-                elif command == 5:
-                    text += "\\heartpiece"
-                elif command == 6:
-                    text += "\\num2"
-                elif command == 7:
-                    text += "\\slow"
-            elif character == 0x0d:
-                text += f"\\wait({simple_hex(character2)})"
-            elif character == 0x0e:
-                text += f"\\sfx({simple_hex(character2)})"
-            elif character == 0x0f:
-                # A bit too complex to parse rn
-                # if character2 >= 0xfc:
-                #    argument = (~character2) & 3
-                #    text += f"\\call(wTextSubstitutions+{argument})"
-                # else:
-                text += f"\\call({simple_hex(character2)})"
-            elif character == 0xb8:
-                # Two parts A button
-                assert character2 == 0xb9
-                text += "Ⓐ"
-            elif character == 0xba:
-                assert character2 == 0xbb
-                text += "Ⓑ"
-    return text
+        address += 2
+    return "".join(pieces)
+
+
+def _text_end(view: memoryview, address: int) -> int:
+    """
+    Finds the address right after the encoded text at the given address, terminator or jump included.
+    """
+    literals = _literals
+    while True:
+        opcode = view[address]
+        if literals[opcode] is not None:
+            address += 1
+        elif opcode == 0x00:
+            return address + 1
+        elif opcode == 0x07:
+            return address + 2
+        else:
+            address += 2
 
 
 def fetch_data(rom: RomData, category_id: int, text_id: int, length: int, text_offset_1_address: int, text_offset_2_address: int) -> list[int]:
     address = text_table_eng_address_seasons + category_id * 2
-    address = rom.read_word(address) + text_table_eng_address_seasons + text_id * 2
-    address = rom.read_word(address)
+    address = rom.read_u16le(address) + text_table_eng_address_seasons + text_id * 2
+    address = rom.read_u16le(address)
     if category_id < text_offset_split_index_seasons:
         address += text_offset_1_address
     else:
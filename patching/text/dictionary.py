@@ -0,0 +1,196 @@
+import heapq
+import time
+from typing import Optional
+
+from .encoding import UNKNOWN_TOKEN, build_encoding_dict, build_token_codes
+from .tokens import FUNCTION_TOKEN_BASE, tokenize
+from ..Util import simple_hex
+
+DICTIONARY_SIZE = 0x400
+MIN_ENTRY_TOKENS = 2
+MAX_ENTRY_TOKENS = 16
+# Using a dictionary entry costs its 2 bytes code, storing it its encoding and a terminator
+DICTIONARY_CODE_COST = 2
+
+# Separates runs of tokens which can be part of a dictionary entry in the corpus
+_RUN_SEPARATOR = "\0"
+
+
+def dictionary_key(index: int) -> str:
+    return f"DICT{index >> 8}_{simple_hex(index & 0xff)}"
+
+
+def _entry_savings(occurrences: int, cost: int) -> int:
+    return occurrences * (cost - DICTIONARY_CODE_COST) - (cost + 1)
+
+
+class _Corpus:
+    """
+    Every run of plain characters of the texts, joined in a single string.
+    Plain characters are their own token ID, so substrings of it are token sequences, and occurrences are found with
+    the string methods.
+    """
+
+    def __init__(self, texts: dict[str, str], token_codes: dict[int, list[int]]) -> None:
+        runs = []
+        for text in texts.values():
+            run = []
+            for token in tokenize(text):
+                if token < FUNCTION_TOKEN_BASE and token in token_codes and token != UNKNOWN_TOKEN:
+                    run.append(chr(token))
+                elif run:
+                    runs.append("".join(run))
+                    run = []
+            if run:
+                runs.append("".join(run))
+        self.data = _RUN_SEPARATOR + _RUN_SEPARATOR.join(runs) + _RUN_SEPARATOR
+        self.claimed = bytearray(len(self.data))
+        self.char_costs = {char: len(token_codes[ord(char)]) for char in set(self.data) if char != _RUN_SEPARATOR}
+
+    def cost(self, entry: str) -> int:
+        return sum(self.char_costs[char] for char in entry)
+
+    def occurrences(self, entry: str) -> list[int]:
+        """
+        Positions of every occurrence of the entry, overlapping ones included.
+        """
+        positions = []
+        position = self.data.find(entry)
+        while position != -1:
+            positions.append(position)
+            position = self.data.find(entry, position + 1)
+        return positions
+
+    def available_occurrences(self, positions: list[int], length: int) -> list[int]:
+        """
+        Keeps the non-overlapping occurrences among the given ones which are not claimed by a previous entry yet.
+        """
+        claimed = self.claimed
+        available = []
+        end = 0
+        for position in positions:
+            if position >= end and claimed.find(1, position, position + length) == -1:
+                available.append(position)
+                end = position + length
+        return available
+
+    def claim(self, positions: list[int], length: int) -> None:
+        for position in positions:
+            self.claimed[position:position + length] = b"\1" * length
+
+    def find_substrings(self, deadline: Optional[float]) -> dict[str, list[int]]:
+        """
+        Finds every substring occurring at least twice, of MIN_ENTRY_TOKENS to MAX_ENTRY_TOKENS tokens, along with the
+        positions of its occurrences.
+        A substring can only be frequent if its prefix is, so each length only extends positions where the shorter
+        substring was frequent. Longer substrings are skipped if the deadline is reached.
+        """
+        data = self.data
+        substrings = {}
+        positions = [i for i in range(len(data) - MIN_ENTRY_TOKENS) if data[i] != _RUN_SEPARATOR]
+        for length in range(MIN_ENTRY_TOKENS, MAX_ENTRY_TOKENS + 1):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            length_occurrences = {}
+            for i in positions:
+                length_occurrences.setdefault(data[i:i + length], []).append(i)
+            positions = []
+            for entry, occurrences in length_occurrences.items():
+                if len(occurrences) >= 2 and _RUN_SEPARATOR not in entry:
+                    substrings[entry] = occurrences
+                    positions.extend(occurrences)
+            positions.sort()
+        return substrings
+
+
+def build_text_dictionary(texts: dict[str, str],
+                          base: Optional[dict[str, str]] = None,
+                          time_budget: Optional[float] = None,
+                          encoding: Optional[dict[str, list[int]]] = None) -> dict[str, str]:
+    """
+    Picks the dictionary entries saving the most bytes over the given texts.
+    Substrings of plain characters are counted once, then picked greedily by savings through a lazy heap: the heap
+    holds an upper bound of the savings of each candidate, and a popped candidate is scored again against the
+    occurrences previous entries didn't claim, being pushed back if it dropped below the next one.
+
+    Parameters:
+        texts (dict[str, str]): The texts the dictionary is made for.
+        base (Optional[dict[str, str]]): A previous dictionary, such as the vanilla one. Its entries are candidates as
+            well and keep their key when picked, and if the time budget runs out, the slots left are filled with them.
+        time_budget (Optional[float]): The number of seconds the search may take, unlimited if None.
+        encoding (Optional[dict[str, list[int]]]): The encoding table, build_encoding_dict() if not given.
+
+    Returns:
+        dict[str, str]: The DICTIONARY_SIZE dictionary entries, unused ones being empty.
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    base = base or {}
+    corpus = _Corpus(texts, build_token_codes(build_encoding_dict() if encoding is None else encoding))
+
+    candidates = corpus.find_substrings(deadline)
+    for entry in base.values():
+        if entry and entry not in candidates and all(char in corpus.char_costs for char in entry):
+            candidates[entry] = corpus.occurrences(entry)
+
+    costs = {}
+    heap = []
+    for entry, positions in candidates.items():
+        cost = corpus.cost(entry)
+        savings = _entry_savings(len(positions), cost)
+        if savings > 0:
+            costs[entry] = cost
+            heap.append((-savings, entry))
+    heapq.heapify(heap)
+
+    selected = []
+    timed_out = False
+    while heap and len(selected) < DICTIONARY_SIZE:
+        if deadline is not None and time.perf_counter() > deadline:
+            timed_out = True
+            break
+        old_savings, entry = heap[0]
+        # Occurrences only ever get claimed, so the ones left are kept for the next time the entry is scored
+        positions = corpus.available_occurrences(candidates[entry], len(entry))
+        candidates[entry] = positions
+        savings = _entry_savings(len(positions), costs[entry])
+        if savings <= 0:
+            heapq.heappop(heap)
+        elif -old_savings != savings:
+            heapq.heapreplace(heap, (-savings, entry))
+        else:
+            heapq.heappop(heap)
+            corpus.claim(positions, len(entry))
+            selected.append(entry)
+
+    if timed_out:
+        selected_entries = set(selected)
+        for entry in base.values():
+            if len(selected) == DICTIONARY_SIZE:
+                break
+            if entry not in selected_entries:
+                selected.append(entry)
+                selected_entries.add(entry)
+
+    # Entries of the base dictionary keep their key, so that a dictionary built incrementally changes as little as
+    # possible
+    dictionary = {}
+    placed = set()
+    free_keys = []
+    selected_entries = set(selected)
+    for i in range(DICTIONARY_SIZE):
+        key = dictionary_key(i)
+        entry = base.get(key)
+        if entry in selected_entries and entry not in placed:
+            dictionary[key] = entry
+            placed.add(entry)
+        else:
+            free_keys.append(key)
+    free_keys.reverse()
+    for entry in selected:
+        if entry not in placed:
+            dictionary[free_keys.pop()] = entry
+            placed.add(entry)
+    for key in free_keys:
+        dictionary[key] = ""
+
+    return {dictionary_key(i): dictionary[dictionary_key(i)] for i in range(DICTIONARY_SIZE)}
@@ -1,23 +1,24 @@
-import re
-from collections import defaultdict
+import hashlib
+import logging
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from functools import lru_cache
-from typing import List, Union, Optional
+from itertools import chain
+from typing import Iterable, List, NamedTuple, Optional
 from . import char_table, kanji_table, text_offset_split_index_seasons, text_offset_1_table_address_seasons, text_offset_2_table_address_seasons, \
     text_table_eng_address_seasons, \
     text_addresses_limit_seasons, text_offset_split_index_ages, text_offset_1_table_address_ages, text_offset_2_table_address_ages, text_table_eng_address_ages, \
     text_addresses_limit_ages
+from .cache import EncodedTextCache, text_cache_key
+from .matcher import DictionaryMatcher
+from .table import TextTable
+from .tokens import FUNCTION_TOKEN_BASE, control_functions, control_keywords, function_token, is_jump, keyword_token, \
+    tokenize
 from ..RomData import RomData
 from ..Util import simple_hex
-from ..z80asm.Assembler import GameboyAddress
-
-control_sequence_pattern = re.compile(r"""
-    \\
-    (jump|cmd|col|charsfx|speed|pos|wait|sfx|call)
-    \(([^)]+)\) |
-    \\(link_name|child_name|w7SecretBuffer1|w7SecretBuffer2|
-    num1|opt|stop|heartpiece|num2|slow)
-""", re.VERBOSE)
-dict_pattern = re.compile(r"DICT(\d+)_([0-9a-f]+)")
 
 
 def add_to_tree(tree: dict[str, list[int]], char: str, keys: list[int]):
@@ -51,6 +52,8 @@ def build_encoding_dict() -> dict[str, list[int]]:
     add_to_tree(tree, "w7SecretBuffer1", [0x0a, 0x02])
     add_to_tree(tree, "w7SecretBuffer2", [0x0a, 0x03])
 
+    add_to_tree(tree, "charsfx", [0x0b, 0x00])
+
     add_to_tree(tree, "speed", [0x0c, 0x00])
     add_to_tree(tree, "num1", [0x0c, 0x08])
     add_to_tree(tree, "opt", [0x0c, 0x10])
@@ -70,242 +73,487 @@ def build_encoding_dict() -> dict[str, list[int]]:
     return tree
 
 
-# --- Trie Data Structure ---
-class TrieNode:
-    def __init__(self):
-        self.children = defaultdict(lambda: TrieNode())
-        self.code = None
-
-
-# --- Global Caches ---
-encode_current_trie: Optional[TrieNode] = None
-encode_current_encoding: Optional[dict[str, list[int]]] = None
-encode_last_ids = (None, None)
-
-control_keywords = {
-    "link_name", "child_name", "w7SecretBuffer1", "w7SecretBuffer2",
-    "num1", "opt", "stop", "heartpiece", "num2", "slow"
-}
-
-control_functions = {
-    "jump", "cmd", "col", "charsfx", "speed", "pos", "wait", "sfx", "call"
-}
-
-
-def next_character(text: str, index: int) -> tuple[Union[str, tuple[str, int]], int]:
-    if index >= len(text):
-        return "\0", 1
-
-    if text[index] != "\\":
-        return text[index], 1
-
-    # Try parsing a function-style command: \name(hex)
-    for name in control_functions:
-        if text.startswith(f"\\{name}(", index):
-            start = index + len(name) + 2  # skip past '\name('
-            end = start + 2
-            value = text[start:end]
-            return (name, int(value, 16)), end + 1 - index
-
-    # Try keyword match (e.g. \opt)
-    for name in control_keywords:
-        if text.startswith(f"\\{name}", index):
-            return name, 1 + len(name)
-
-    raise Exception()
-
-
-def build_trie(dictionary: dict[str, str]) -> TrieNode:
-    root = TrieNode()
-    for key, value in dictionary.items():
-        node = root
-        i = 0
-        while i < len(value):
-            token, length = next_character(value, i)
-            node = node.children[token]
-            i += length
-        node.code = [2 + int(key[4]), int(key[6:8], 16)]
-    return root
-
-
-@lru_cache
-def recursive_encode(text: str, index: int) -> tuple[int]:
-    if index >= len(text):
-        return (0,)
-
-    token, length = next_character(text, index)
-    if isinstance(token, tuple):
-        encoded = list(encode_current_encoding[token[0]])
-        encoded[-1] += token[1]
-        if token[0] == "jump":
-            return tuple(encoded)
+def build_token_codes(encoding: dict[str, list[int]]) -> dict[int, list[int]]:
+    """
+    Converts an encoding dict into the codes of every token ID it can encode.
+    """
+    codes = {}
+    for name, code in encoding.items():
+        if name in control_functions:
+            for value in range(0x100):
+                codes[function_token(name, value)] = code[:-1] + [code[-1] + value]
+        elif name in control_keywords:
+            codes[keyword_token(name)] = code
+        elif len(name) == 1:
+            codes[ord(name)] = code
+    return codes
+
+
+# Unknown characters are encoded as a white square
+UNKNOWN_TOKEN = ord("口")
+
+# Bumped whenever a change of the encoder may change its output, to invalidate persisted encodings
+ENCODER_VERSION = 2
+
+# Smallest number of texts sent to a worker at once, below which the pool overhead isn't worth it
+ENCODE_CHUNK_MIN_SIZE = 64
+
+
+class TextEncoder:
+    """
+    Encodes texts using a given encoding table and dictionary.
+    An encoder owns its token codes, its dictionary matcher and its cache, so separate encoders never interfere with
+    each other, and a single encoder can be shared between threads.
+    """
+
+    def __init__(self,
+                 encoding: Optional[dict[str, list[int]]] = None,
+                 dictionary: Optional[dict[str, str]] = None,
+                 cache_size: int = 0x1000) -> None:
+        """
+        Parameters:
+            encoding (Optional[dict[str, list[int]]]): The encoding table, build_encoding_dict() if not given.
+            dictionary (Optional[dict[str, str]]): The dictionary entries to compress texts with, none if not given.
+            cache_size (int): The maximum number of encoded texts to keep, the least recently used being dropped first.
+        """
+        self.encoding = build_encoding_dict() if encoding is None else encoding
+        self.token_codes = build_token_codes(self.encoding)
+        self.matcher = DictionaryMatcher.from_dictionary(dictionary or {}, self.token_codes)
+        # An unknown token is encoded as UNKNOWN_TOKEN, so it is the start of the entries starting with UNKNOWN_TOKEN.
+        # The tokens following it are still matched as they are.
+        unknown_entries = {}
+        for key, value in (dictionary or {}).items():
+            if value.startswith(chr(UNKNOWN_TOKEN)):
+                unknown_entries[tuple(tokenize(value)[1:])] = [2 + int(key[4]), int(key[6:8], 16)]
+        self._unknown_entries = sorted(unknown_entries.items(), key=lambda entry: len(entry[0]))
+        # Identifies the output of this encoder, for content-addressed caches
+        version_source = repr((ENCODER_VERSION, sorted(self.encoding.items()), list((dictionary or {}).items())))
+        self.version = hashlib.blake2b(version_source.encode("utf-8"), digest_size=32).digest()
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[int, ...]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def encode(self, text: str) -> list[int]:
+        if self.cache_size:
+            with self._cache_lock:
+                encoded = self._cache.get(text)
+                if encoded is not None:
+                    self._cache.move_to_end(text)
+                    return list(encoded)
+
+        encoded = self.encode_tokens(tokenize(text))
+
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache[text] = tuple(encoded)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return encoded
+
+    def encode_tokens(self, tokens: list[int]) -> list[int]:
+        """
+        Finds the shortest encoding of a tokenized text using dictionary entries, as a bottom-up pass from its end.
+        Every dictionary match is found beforehand in a single pass, then for each token position the best cost of
+        encoding the rest of the text is stored along with the chosen code and the position to continue from, and the
+        output is rebuilt in a single forward pass at the end.
+        Ties are broken like a top-down search would: literal first, then shortest dictionary entry.
+        An unknown token is encoded as UNKNOWN_TOKEN, including when it starts a dictionary entry.
+        """
+        token_count = len(tokens)
+        matches = self.matcher.find_matches(tokens)
+        token_codes = self.token_codes
+        if self._unknown_entries:
+            for i, token in enumerate(tokens):
+                if token not in token_codes:
+                    matches[i] = [(len(rest) + 1, code) for rest, code in self._unknown_entries
+                                  if tuple(tokens[i + 1:i + 1 + len(rest)]) == rest]
+
+        # Position token_count is the terminator, unless the text ends with a jump
+        costs = [0] * (token_count + 1)
+        codes: list[list[int]] = [[]] * (token_count + 1)
+        next_positions = [-1] * (token_count + 1)
+        costs[token_count] = 1
+        codes[token_count] = [0]
+
+        for i in range(token_count - 1, -1, -1):
+            token = tokens[i]
+            if token >= FUNCTION_TOKEN_BASE:
+                encoded = token_codes[token]
+                if is_jump(token):
+                    costs[i] = len(encoded)
+                    codes[i] = encoded
+                    continue
+            elif token in token_codes:
+                encoded = token_codes[token]
+            else:
+                encoded = token_codes[UNKNOWN_TOKEN]
+
+            best_cost = len(encoded) + costs[i + 1]
+            best_code = encoded
+            best_next = i + 1
+            for length, code in matches[i]:
+                candidate_cost = len(code) + costs[i + length]
+                if candidate_cost < best_cost:
+                    best_cost = candidate_cost
+                    best_code = code
+                    best_next = i + length
+
+            costs[i] = best_cost
+            codes[i] = best_code
+            next_positions[i] = best_next
+
+        result = []
+        position = 0
+        while position != -1:
+            result.extend(codes[position])
+            position = next_positions[position]
+        return result
+
+    def encode_dict(self, text_data: dict[str, str]) -> dict[str, list[int]]:
+        return {key: self.encode(text) for key, text in text_data.items()}
+
+
+@lru_cache(maxsize=4)
+def _get_text_encoder(encoding_items: tuple, dictionary_items: tuple) -> TextEncoder:
+    encoding = {name: list(code) for name, code in encoding_items}
+    return TextEncoder(encoding, dict(dictionary_items))
+
+
+@lru_cache(maxsize=1)
+def _default_encoding_items() -> tuple:
+    return tuple((name, tuple(code)) for name, code in build_encoding_dict().items())
+
+
+def get_text_encoder(encoding: Optional[dict[str, list[int]]], dictionary: Optional[dict[str, str]]) -> TextEncoder:
+    """
+    Returns a shared encoder for the given encoding table and dictionary, keyed by their content rather than their
+    identity so that a recycled id or a table changed in place can never hit a stale encoder.
+    Looking it up hashes the whole tables, so callers encoding many texts look it up once and reuse it.
+    """
+    if encoding is None:
+        encoding_items = _default_encoding_items()
     else:
-        if token not in encode_current_encoding:
-            token = "口"  # Use a white square to denote unknown characters
-        encoded = encode_current_encoding[token]
-
-    best = list(encoded) + list(recursive_encode(text, index + length))
-
-    if token not in encode_current_trie.children:
-        # No dict entry
-        return tuple(best)
-
-    node = encode_current_trie.children[token]
-    i = index + length
-    depth = 1
-
-    while i < len(text):
-        token2, tlen = next_character(text, i)
-        if token2 not in node.children:
-            break
-        node = node.children[token2]
-        i += tlen
-        depth += 1
-        if node.code:
-            candidate = node.code + list(recursive_encode(text, i))
-            if len(candidate) < len(best):
-                best = candidate
-
-    return tuple(best)
+        encoding_items = tuple((name, tuple(code)) for name, code in encoding.items())
+    dictionary_items = tuple(dictionary.items()) if dictionary else ()
+    return _get_text_encoder(encoding_items, dictionary_items)
 
 
 # --- Main Function ---
 def encode_text(text: str, encoding: dict[str, List[int]], dictionary: dict[str, str]) -> List[int]:
-    global encode_current_trie, encode_current_encoding, encode_last_ids
-    id_dict = id(dictionary)
-    id_enc = id(encoding)
-
-    # Rebuild trie/cache if dictionary/encoding changed
-    if encode_last_ids != (id_dict, id_enc):
-        encode_current_trie = build_trie(dictionary)
-        encode_current_encoding = encoding
-        encode_last_ids = (id_dict, id_enc)
-
-    result = list(recursive_encode(text, 0))
-    return result
-
-
-def encode_dict(text_data: dict[str, str], dictionary: Optional[dict[str, str]] = None) -> dict[str, list[int]]:
-    if dictionary is None:
-        dictionary = {}
-    encoding_dict = build_encoding_dict()
-    encoded_dict = {}
-    for key in text_data:
-        encoded_text = encode_text(text_data[key], encoding_dict, dictionary)
-        encoded_dict[key] = encoded_text
-    recursive_encode.cache_clear()
-    return encoded_dict
-
-
-def build_compact_table(data: dict[str, list[int]]) -> tuple[list[int], dict[str, int]]:
+    return get_text_encoder(encoding, dictionary).encode(text)
+
+
+# Encoder of a process pool worker, built once by the pool initializer
+_worker_encoder: Optional[TextEncoder] = None
+
+
+def _init_encode_worker(dictionary_items: tuple) -> None:
+    global _worker_encoder
+    _worker_encoder = TextEncoder(None, dict(dictionary_items), cache_size=0)
+
+
+def _encode_chunk(texts: list[str]) -> list[list[int]]:
+    return [_worker_encoder.encode(text) for text in texts]
+
+
+def encode_dict(text_data: dict[str, str],
+                dictionary: Optional[dict[str, str]] = None,
+                workers: int = 1,
+                cache: Optional[EncodedTextCache] = None) -> dict[str, list[int]]:
+    """
+    Encodes every text of text_data, compressing them with the dictionary entries if given.
+    With several workers, texts are split in chunks encoded by a process pool, each worker building its dictionary
+    matcher once. Results are the same as with a single worker, in the same key order.
+    If a cache is given, only texts which are not in it yet get encoded, and they are added to it.
+    """
+    # Looked up once, as the same encoder gives the cache version and encodes every text
+    encoder = get_text_encoder(None, dictionary)
+    if cache is None:
+        return _encode_texts(text_data, dictionary, workers, encoder)
+
+    version = encoder.version
+    cached_texts = {}
+    missing_texts = {}
+    missing_keys = {}
+    for key, text in text_data.items():
+        cache_key = text_cache_key(text, version)
+        encoded = cache.get(cache_key)
+        if encoded is None:
+            missing_texts[key] = text
+            missing_keys[key] = cache_key
+        else:
+            cached_texts[key] = list(encoded)
+
+    encoded_texts = _encode_texts(missing_texts, dictionary, workers, encoder)
+    for key, encoded in encoded_texts.items():
+        cache.put(missing_keys[key], bytes(encoded))
+    cached_texts.update(encoded_texts)
+    return {key: cached_texts[key] for key in text_data}
+
+
+def _encode_texts(text_data: dict[str, str],
+                  dictionary: Optional[dict[str, str]],
+                  workers: int,
+                  encoder: TextEncoder) -> dict[str, list[int]]:
+    if workers <= 1 or len(text_data) < workers * ENCODE_CHUNK_MIN_SIZE:
+        return encoder.encode_dict(text_data)
+
+    keys = list(text_data)
+    texts = [text_data[key] for key in keys]
+    chunk_size = max(ENCODE_CHUNK_MIN_SIZE, -(-len(texts) // (workers * 4)))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    dictionary_items = tuple(dictionary.items()) if dictionary else ()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_encode_worker, initargs=(dictionary_items,)) as pool:
+        encoded_texts = chain.from_iterable(pool.map(_encode_chunk, chunks))
+        return dict(zip(keys, encoded_texts))
+
+
+def build_compact_table(data: dict[str, list[int]], overlap: bool = False) -> tuple[list[int], dict[str, int]]:
+    """
+    Packs encoded texts in a single table, a text which is the end of a longer one pointing into it instead of being
+    stored again.
+    Texts are placed longest first, and every suffix of a placed text (of a length some text actually has) is hashed
+    along with where it ends, so finding whether a text can be shared is a single lookup. The earliest placed text is
+    used when several could be, which gives the same offsets as comparing against every placed text in order.
+    If overlap is set, texts which could not be shared that way are then laid out as a greedy shortest common
+    superstring: a text found anywhere in the table is shared, otherwise the next text placed is the one whose start
+    overlaps the end of the table the most. This saves more bytes, but moves offsets around.
+    """
     sorted_items = sorted(data.items(), key=lambda kv: -len(kv[1]))
-    compact = []
-    offsets = {}
+    lengths = sorted({len(seq) for seq in data.values()})
 
+    # Texts which are stored as is, and where every text lies within one of them
+    roots: list[bytes] = []
+    placements: dict[str, tuple[int, int]] = {}
+    suffix_ends: dict[bytes, tuple[int, int]] = {}
     for key, seq in sorted_items:
-        for key2 in offsets:
-            string_end = offsets[key2] + len(data[key2])
-            if compact[string_end - len(seq):string_end] == seq:
-                offset = string_end - len(seq)
+        seq = bytes(seq)
+        root_end = suffix_ends.get(seq)
+        if root_end is not None:
+            root, end = root_end
+            placements[key] = (root, end - len(seq))
+            continue
+        root = len(roots)
+        roots.append(seq)
+        placements[key] = (root, 0)
+        for length in lengths:
+            if length > len(seq):
                 break
-        else:
-            offset = len(compact)
-            compact.extend(seq)
-        offsets[key] = offset
-    assert len(compact) <= 0xffff
-
-    return compact, offsets
+            suffix_ends.setdefault(seq[len(seq) - length:], (root, len(seq)))
 
+    if overlap:
+        compact, root_offsets = _chain_overlapping(roots)
+    else:
+        compact = bytearray()
+        root_offsets = []
+        for seq in roots:
+            root_offsets.append(len(compact))
+            compact += seq
+    assert len(compact) <= 0xffff
 
-def write_text_data(rom: RomData, dictionary: dict[str, str], texts: dict[str, str], seasons: bool):
+    offsets = {key: root_offsets[root] + start for key, (root, start) in placements.items()}
+    return list(compact), offsets
+
+
+# Longest overlap between the end of a text and the start of the next one looked for when chaining texts
+MAX_TEXT_OVERLAP = 16
+
+
+def _chain_overlapping(roots: list[bytes]) -> tuple[bytearray, list[int]]:
+    # Unplaced texts starting with each prefix, in reverse order so that the longest one is popped first
+    by_prefix: dict[bytes, list[int]] = {}
+    for i, seq in enumerate(roots):
+        for length in range(1, min(len(seq), MAX_TEXT_OVERLAP + 1)):
+            by_prefix.setdefault(seq[:length], []).append(i)
+    for candidates in by_prefix.values():
+        candidates.reverse()
+
+    compact = bytearray()
+    root_offsets = [-1] * len(roots)
+    next_in_order = 0
+    while True:
+        chosen = None
+        overlap = 0
+        for length in range(min(len(compact), MAX_TEXT_OVERLAP), 0, -1):
+            candidates = by_prefix.get(bytes(compact[-length:]))
+            while candidates and root_offsets[candidates[-1]] != -1:
+                candidates.pop()
+            if candidates:
+                chosen = candidates.pop()
+                overlap = length
+                break
+        if chosen is None:
+            while next_in_order < len(roots) and root_offsets[next_in_order] != -1:
+                next_in_order += 1
+            if next_in_order == len(roots):
+                return compact, root_offsets
+            chosen = next_in_order
+
+        seq = roots[chosen]
+        position = compact.find(seq)
+        if position != -1:
+            root_offsets[chosen] = position
+        else:
+            root_offsets[chosen] = len(compact) - overlap
+            compact += seq[overlap:]
+
+
+def _encode_entries(texts: dict[str, str],
+                    keys: list[str],
+                    dictionary: dict[str, str],
+                    cache: Optional[EncodedTextCache]) -> dict[str, list[int]]:
+    """
+    Encodes the given entries of texts. Untouched entries of a TextTable read with the same dictionary keep their
+    original bytes, and are not even decoded.
+    """
+    original = {}
+    if isinstance(texts, TextTable) and texts.dictionary == dictionary:
+        for key in keys:
+            encoded = texts.original_bytes(key)
+            if encoded is not None:
+                original[key] = list(encoded)
+
+    encoded_texts = encode_dict({key: texts[key] for key in keys if key not in original}, dictionary, cache=cache)
+    return {key: original[key] if key in original else encoded_texts[key] for key in keys}
+
+
+class TextBankUsage(NamedTuple):
+    """
+    Where the texts of an offset table were written, and the address the next data can't go past.
+    """
+    start: int
+    end: int
+    limit: int
+
+    @property
+    def free_bytes(self) -> int:
+        return self.limit - self.end
+
+
+def _group_text_keys(keys: Iterable[str]) -> dict[int, list[str]]:
+    """
+    Groups text keys by category in a single pass. Each category holds its texts with consecutive subids starting from
+    0, the ones after a missing subid being left out as the game couldn't reach them.
+    """
+    subids: dict[int, dict[int, str]] = {}
+    for key in keys:
+        if len(key) != 7 or not key.startswith("TX_"):
+            continue
+        try:
+            category = int(key[3:5], 16)
+            subid = int(key[5:7], 16)
+        except ValueError:
+            continue
+        if key[3:] == f"{category:02x}{subid:02x}":
+            subids.setdefault(category, {})[subid] = key
+
+    categories = {}
+    for category, category_keys in subids.items():
+        consecutive_keys = []
+        while len(consecutive_keys) in category_keys:
+            consecutive_keys.append(category_keys[len(consecutive_keys)])
+        categories[category] = consecutive_keys
+    return categories
+
+
+def _word_table(values: Iterable[int]) -> bytes:
+    table = array("H", (value & 0xffff for value in values))
+    if sys.byteorder == "big":
+        table.byteswap()
+    return table.tobytes()
+
+
+def write_text_data(rom: RomData,
+                    dictionary: dict[str, str],
+                    texts: dict[str, str],
+                    seasons: bool,
+                    cache: Optional[EncodedTextCache] = None,
+                    overlap: bool = False) -> list[TextBankUsage]:
+    """
+    Encodes the texts and dictionary and writes them to the ROM along with their offset tables.
+
+    Returns:
+        list[TextBankUsage]: The space used by the texts of each of the two offset tables.
+    """
     if seasons:
         text_offset_split_index = text_offset_split_index_seasons
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_seasons), rom.read_word(text_offset_1_table_address_seasons + 1))
-        text_offset_2 = GameboyAddress(rom.read_byte(text_offset_2_table_address_seasons), rom.read_word(text_offset_2_table_address_seasons + 1))
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_seasons)
+        text_offset_2_address = rom.read_far_pointer(text_offset_2_table_address_seasons)
         text_table_eng_address = text_table_eng_address_seasons
         text_addresses_limit = text_addresses_limit_seasons
     else:
         text_offset_split_index = text_offset_split_index_ages
-        text_offset_1 = GameboyAddress(rom.read_byte(text_offset_1_table_address_ages), rom.read_word(text_offset_1_table_address_ages + 1))
-        text_offset_2 = GameboyAddress(rom.read_byte(text_offset_2_table_address_ages), rom.read_word(text_offset_2_table_address_ages + 1))
+        text_offset_1_address = rom.read_far_pointer(text_offset_1_table_address_ages)
+        text_offset_2_address = rom.read_far_pointer(text_offset_2_table_address_ages)
         text_table_eng_address = text_table_eng_address_ages
         text_addresses_limit = text_addresses_limit_ages
 
-    dict1 = {}
-    dict2 = {}
+    keys1 = []
+    keys2 = []
     for key in texts:
         if int(key[3:5], 16) < text_offset_split_index - 4:
-            dict1[key] = texts[key]
+            keys1.append(key)
         else:
-            dict2[key] = texts[key]
+            keys2.append(key)
 
-    encoded_dict1 = encode_dict(dict1, dictionary)
-    encoded_dict1.update(encode_dict(dictionary))
-    encoded_dict2 = encode_dict(dict2, dictionary)
+    encoded_dict1 = _encode_entries(texts, keys1, dictionary, cache)
+    encoded_dict1.update(encode_dict(dictionary, cache=cache))
+    encoded_dict2 = _encode_entries(texts, keys2, dictionary, cache)
+    if cache is not None:
+        cache.save()
 
     offset_table_length = (len(encoded_dict1) + len(encoded_dict2)) * 2
-    text_offset_1_address = text_offset_1.address_in_rom()
-    text_offset_2_address = text_offset_2.address_in_rom()
-    text_table_current_address = text_table_eng_address
-    tx_table_current_address = text_table_eng_address + 0x64 * 2
-    text_offset_1_offset = text_table_eng_address + 0x64 * 2 + offset_table_length - text_offset_1_address
+    offsets_address = text_table_eng_address + 0x64 * 2
+    text_offset_1_offset = offsets_address + offset_table_length - text_offset_1_address
     assert text_offset_1_offset >= 0
 
-    compact_table1, compact_offsets1 = build_compact_table(encoded_dict1)
-    rom.write_bytes(text_offset_1_address + text_offset_1_offset, compact_table1)
-
-    for i in range(4):
-        rom.write_word(text_table_current_address, tx_table_current_address - text_table_eng_address)
-        text_table_current_address += 2
-        for j in range(0, 0x100):
-            entry_name = f"DICT{i}_{simple_hex(j)}"
-            rom.write_word(tx_table_current_address, compact_offsets1[entry_name] + text_offset_1_offset)
-            tx_table_current_address += 2
-
-    for i in range(text_offset_split_index - 4):
-        start_address = tx_table_current_address
-        subid = 0
-        while True:
-            tx = f"TX_{simple_hex(i)}{simple_hex(subid)}"
-            if tx not in dict1:
-                break
-            subid += 1
-
-            rom.write_word(tx_table_current_address, compact_offsets1[tx] + text_offset_1_offset)
-            tx_table_current_address += 2
-        if subid > 0:
-            rom.write_word(text_table_current_address, start_address - text_table_eng_address)
-        else:
-            rom.write_word(text_table_current_address, 0)
-        text_table_current_address += 2
+    compact_table1, compact_offsets1 = build_compact_table(encoded_dict1, overlap)
+    text_data_1_address = text_offset_1_address + text_offset_1_offset
+    rom.write_bytes(text_data_1_address, compact_table1)
 
     if __debug__ and False:
         sorted_dict = sorted(list(encoded_dict1.items()) + list(encoded_dict2.items()), key=lambda kv: -len(kv[1]))
         for entry in sorted_dict:
-            if entry[0] in dict1:
-                print(entry[0], dict1[entry[0]], len(entry[1]))
-            elif entry[0] in dict2:
-                print(entry[0], dict2[entry[0]], len(entry[1]))
-    text_offset_2_offset = max(0, text_offset_1_address + text_offset_1_offset + len(compact_table1) - text_offset_2_address)
-    compact_table2, compact_offsets2 = build_compact_table(encoded_dict2)
-    assert text_offset_2_address + text_offset_2_offset + len(compact_table2) < text_addresses_limit, \
-        f"Text is too long ({text_offset_2_address + text_offset_2_offset + len(compact_table2) - text_addresses_limit} too many bytes)"
-    print(f"Free text bytes: {text_addresses_limit - text_offset_2_address - text_offset_2_offset - len(compact_table2)}")
-    rom.write_bytes(text_offset_2_address + text_offset_2_offset, compact_table2)
-
-    for i in range(text_offset_split_index - 4, 0x60):
-        start_address = tx_table_current_address
-        subid = 0
-        while True:
-            tx = f"TX_{simple_hex(i)}{simple_hex(subid)}"
-            if tx not in dict2:
-                break
-            subid += 1
-
-            rom.write_word(tx_table_current_address, compact_offsets2[tx] + text_offset_2_offset)
-            tx_table_current_address += 2
-        if subid > 0:
-            rom.write_word(text_table_current_address, start_address - text_table_eng_address)
+            if entry[0] in texts:
+                print(entry[0], texts[entry[0]], len(entry[1]))
+    text_offset_2_offset = max(0, text_data_1_address + len(compact_table1) - text_offset_2_address)
+    compact_table2, compact_offsets2 = build_compact_table(encoded_dict2, overlap)
+    text_data_2_address = text_offset_2_address + text_offset_2_offset
+    assert text_data_2_address + len(compact_table2) < text_addresses_limit, \
+        f"Text is too long ({text_data_2_address + len(compact_table2) - text_addresses_limit} too many bytes)"
+    rom.write_bytes(text_data_2_address, compact_table2)
+
+    # Category table first (4 dictionary groups, then 0x60 text categories), then the offsets of every entry of every
+    # category, all relative to their bank of text data
+    category_offsets = []
+    entry_offsets = []
+    for i in range(4):
+        category_offsets.append(offsets_address + len(entry_offsets) * 2 - text_table_eng_address)
+        entry_offsets.extend(compact_offsets1[f"DICT{i}_{simple_hex(j)}"] + text_offset_1_offset for j in range(0x100))
+
+    categories1 = _group_text_keys(encoded_dict1)
+    categories2 = _group_text_keys(encoded_dict2)
+    for i in range(0x60):
+        if i < text_offset_split_index - 4:
+            category_keys = categories1.get(i)
+            compact_offsets = compact_offsets1
+            text_offset = text_offset_1_offset
         else:
-            rom.write_word(text_table_current_address, 0)
-        text_table_current_address += 2
+            category_keys = categories2.get(i)
+            compact_offsets = compact_offsets2
+            text_offset = text_offset_2_offset
+        if not category_keys:
+            category_offsets.append(0)
+            continue
+        category_offsets.append(offsets_address + len(entry_offsets) * 2 - text_table_eng_address)
+        entry_offsets.extend(compact_offsets[key] + text_offset for key in category_keys)
+
+    rom.write_bytes(text_table_eng_address, _word_table(category_offsets))
+    rom.write_bytes(offsets_address, _word_table(entry_offsets))
+
+    usage = [
+        TextBankUsage(text_data_1_address, text_data_1_address + len(compact_table1), text_data_2_address),
+        TextBankUsage(text_data_2_address, text_data_2_address + len(compact_table2), text_addresses_limit),
+    ]
+    logging.debug("Free text bytes: %d", usage[-1].free_bytes)
+    return usage
@@ -0,0 +1,108 @@
+from array import array
+from collections.abc import Container, Iterable
+
+from .tokens import tokenize
+
+
+class DictionaryMatcher:
+    """
+    Aho-Corasick automaton over the token IDs of the dictionary entries, finding every dictionary entry occurring in a
+    text in a single linear pass.
+    States are numbered in breadth-first order, and everything is stored in flat arrays indexed by state: the
+    transitions of state s for every symbol of the alphabet are at [s * width, (s + 1) * width).
+    """
+
+    def __init__(self, entries: Iterable[tuple[list[int], list[int]]]) -> None:
+        """
+        Parameters:
+            entries (Iterable[tuple[list[int], list[int]]]): The tokens of every dictionary entry along with its code.
+                If several entries have the same tokens, the last one is used.
+        """
+        entries = [(tokens, code) for tokens, code in entries if tokens]
+
+        # Dense alphabet of the tokens used in the dictionary, symbol 0 standing for any other token
+        self.symbols: dict[int, int] = {}
+        for tokens, _ in entries:
+            for token in tokens:
+                if token not in self.symbols:
+                    self.symbols[token] = len(self.symbols) + 1
+        width = len(self.symbols) + 1
+        self.width = width
+
+        # Plain trie first, with sparse children
+        children: list[dict[int, int]] = [{}]
+        depths = [0]
+        state_codes: list[list[int]] = [[]]
+        for tokens, code in entries:
+            state = 0
+            for token in tokens:
+                symbol = self.symbols[token]
+                next_state = children[state].get(symbol)
+                if next_state is None:
+                    next_state = len(children)
+                    children[state][symbol] = next_state
+                    children.append({})
+                    depths.append(depths[state] + 1)
+                    state_codes.append([])
+                state = next_state
+            state_codes[state] = code
+
+        # Then the full transition table, filled in breadth-first order so that the row of the failure state of a state
+        # is always complete when copied
+        state_count = len(children)
+        transitions = array("i", [0]) * (state_count * width)
+        failures = array("i", [0]) * state_count
+        output_links = array("i", [0]) * state_count
+        queue = []
+        for symbol, child in children[0].items():
+            transitions[symbol] = child
+            queue.append(child)
+        for state in queue:
+            failure = failures[state]
+            row = state * width
+            transitions[row:row + width] = transitions[failure * width:(failure + 1) * width]
+            for symbol, child in children[state].items():
+                transitions[row + symbol] = child
+                child_failure = transitions[failure * width + symbol]
+                failures[child] = child_failure
+                output_links[child] = child_failure if state_codes[child_failure] else output_links[child_failure]
+                queue.append(child)
+
+        self.transitions = transitions
+        self.failures = failures
+        self.output_links = output_links
+        self.depths = array("i", depths)
+        self.codes = state_codes
+
+    @classmethod
+    def from_dictionary(cls, dictionary: dict[str, str], known_tokens: Container[int]) -> "DictionaryMatcher":
+        """
+        Builds the matcher of dictionary entries, leaving out the ones starting with a token which is not known, as
+        such a token is always encoded as an unknown character instead of being matched.
+        """
+        entries = ((tokenize(value), [2 + int(key[4]), int(key[6:8], 16)]) for key, value in dictionary.items())
+        return cls((tokens, code) for tokens, code in entries if tokens and tokens[0] in known_tokens)
+
+    def find_matches(self, tokens: list[int]) -> list[list[tuple[int, list[int]]]]:
+        """
+        Finds every dictionary entry occurring in the tokens.
+
+        Returns:
+            list: For every start position, the (length in tokens, code) of the entries starting there, shortest first.
+        """
+        matches: list[list[tuple[int, list[int]]]] = [[] for _ in range(len(tokens))]
+        symbols = self.symbols
+        transitions = self.transitions
+        width = self.width
+        codes = self.codes
+        depths = self.depths
+        output_links = self.output_links
+        state = 0
+        for end, token in enumerate(tokens, 1):
+            state = transitions[state * width + symbols.get(token, 0)]
+            match_state = state if codes[state] else output_links[state]
+            while match_state:
+                length = depths[match_state]
+                matches[end - length].append((length, codes[match_state]))
+                match_state = output_links[match_state]
+        return matches
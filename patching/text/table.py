@@ -0,0 +1,117 @@
+from collections.abc import Iterator, MutableMapping
+from mmap import mmap
+from typing import Optional, Union
+
+from .decoding import _decode_text, _text_end, read_text_addresses
+from ..RomData import RomData
+
+Buffer = Union[bytes, bytearray, memoryview, mmap]
+
+# Placeholder address of texts which are not in the ROM
+_NO_ADDRESS = -1
+
+
+class TextTable(MutableMapping[str, str]):
+    """
+    The texts of a ROM, decoded only when accessed.
+    The offset tables are indexed once, and the texts of the ROM are copied so that writing texts back to it doesn't
+    change what untouched entries decode to. Modified entries are tracked, so that write_text_data can reuse the
+    original bytes of the other ones instead of encoding them again.
+    """
+
+    def __init__(self, rom: RomData, dictionary: dict[str, str], seasons: bool) -> None:
+        """
+        Parameters:
+            rom (RomData): The ROM to read texts from.
+            dictionary (dict[str, str]): The dictionary the texts of the ROM were encoded with.
+            seasons (bool): Reads the texts of seasons if true, otherwise ages.
+        """
+        self.dictionary = dictionary
+        addresses = read_text_addresses(rom, seasons)
+        if addresses:
+            # Only the span holding the texts is copied, rather than the whole ROM
+            with memoryview(rom.file) as view:
+                start = min(addresses.values())
+                end = max(_text_end(view, address) for address in set(addresses.values()))
+                self._data = bytes(view[start:end])
+            self._addresses = {key: address - start for key, address in addresses.items()}
+        else:
+            self._data = b""
+            self._addresses = {}
+        self._texts: dict[str, str] = {}
+        self._modified: set[str] = set()
+
+    @classmethod
+    def from_encoded(cls,
+                     dictionary: dict[str, str],
+                     data: Buffer,
+                     addresses: dict[str, int],
+                     texts: Optional[dict[str, str]] = None) -> "TextTable":
+        """
+        Builds a table over texts which are already encoded somewhere else than in a ROM, such as in a cache file.
+
+        Parameters:
+            dictionary (dict[str, str]): The dictionary the texts were encoded with.
+            data (Buffer): The encoded texts. It must not change as long as the table is used.
+            addresses (dict[str, int]): The offset of every text in data.
+            texts (Optional[dict[str, str]]): Texts which are only known decoded, overriding their address. They have
+                no original bytes, and are encoded again when written.
+        """
+        table = cls.__new__(cls)
+        table.dictionary = dictionary
+        table._data = data
+        table._addresses = dict(addresses)
+        table._texts = {}
+        table._modified = set()
+        if texts:
+            for key, text in texts.items():
+                table._addresses[key] = _NO_ADDRESS
+                table._texts[key] = text
+        return table
+
+    def __getitem__(self, key: str) -> str:
+        text = self._texts.get(key)
+        if text is None:
+            address = self._addresses[key]
+            with memoryview(self._data) as view:
+                text = self._texts[key] = _decode_text(view, address, self.dictionary)
+        return text
+
+    def __setitem__(self, key: str, text: str) -> None:
+        if key not in self._addresses:
+            self._addresses[key] = _NO_ADDRESS
+        self._texts[key] = text
+        self._modified.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        del self._addresses[key]
+        self._texts.pop(key, None)
+        self._modified.discard(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._addresses)
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._addresses
+
+    def is_modified(self, key: str) -> bool:
+        return key in self._modified
+
+    @property
+    def modified_keys(self) -> set[str]:
+        return set(self._modified)
+
+    def original_bytes(self, key: str) -> Optional[bytes]:
+        """
+        The encoded bytes of an entry as found in the ROM, or None if it was modified or added since, or if it is only
+        known decoded.
+        They only decode to the same text with the dictionary of the table.
+        """
+        address = self._addresses[key]
+        if key in self._modified or address == _NO_ADDRESS:
+            return None
+        with memoryview(self._data) as view:
+            return self._data[address:_text_end(view, address)]
@@ -0,0 +1,69 @@
+import re
+
+# Texts are tokenized into integers: plain characters are their code point, and control sequences get IDs past the end
+# of Unicode, function-style ones (\name(hex)) embedding their argument in the low byte
+FUNCTION_TOKEN_BASE = 0x110000
+KEYWORD_TOKEN_BASE = FUNCTION_TOKEN_BASE + 0x10000
+
+control_functions = ("jump", "cmd", "col", "charsfx", "speed", "pos", "wait", "sfx", "call")
+
+control_keywords = (
+    "link_name", "child_name", "w7SecretBuffer1", "w7SecretBuffer2",
+    "num1", "opt", "stop", "heartpiece", "num2", "slow"
+)
+
+# A backslash not followed by a known control sequence matches with both groups empty, and is rejected
+control_pattern = re.compile(r"\\(?:(" + "|".join(control_functions) + r")\((..).|("
+                             + "|".join(control_keywords) + "))?", re.DOTALL)
+
+
+def function_token(name: str, value: int) -> int:
+    return FUNCTION_TOKEN_BASE + (control_functions.index(name) << 8) + value
+
+
+def keyword_token(name: str) -> int:
+    return KEYWORD_TOKEN_BASE + control_keywords.index(name)
+
+
+JUMP_TOKEN = function_token("jump", 0)
+_function_ids = {name: FUNCTION_TOKEN_BASE + (i << 8) for i, name in enumerate(control_functions)}
+_keyword_ids = {name: KEYWORD_TOKEN_BASE + i for i, name in enumerate(control_keywords)}
+
+
+def is_jump(token: int) -> bool:
+    return JUMP_TOKEN <= token < JUMP_TOKEN + 0x100
+
+
+def tokenize(text: str) -> list[int]:
+    """
+    Turns a text into a list of token IDs in a single pass, plain runs of characters being converted at once.
+    Nothing after a jump is ever encoded, so tokenization stops there.
+    """
+    tokens = []
+    position = 0
+    for match in control_pattern.finditer(text):
+        tokens.extend(map(ord, text[position:match.start()]))
+        position = match.end()
+        function_name, value, keyword = match.groups()
+        if function_name is not None:
+            token = _function_ids[function_name] + int(value, 16)
+            tokens.append(token)
+            if function_name == "jump":
+                return tokens
+        elif keyword is not None:
+            tokens.append(_keyword_ids[keyword])
+        else:
+            raise Exception(f"Unknown control sequence at index {match.start()} of {repr(text)}")
+    tokens.extend(map(ord, text[position:]))
+    return tokens
+
+
+def token_to_text(token: int) -> str:
+    """
+    Converts a token ID back to its text form.
+    """
+    if token < FUNCTION_TOKEN_BASE:
+        return chr(token)
+    if token < KEYWORD_TOKEN_BASE:
+        return f"\\{control_functions[(token - FUNCTION_TOKEN_BASE) >> 8]}({token & 0xff:02x})"
+    return f"\\{control_keywords[token - KEYWORD_TOKEN_BASE]}"
@@ -1,43 +1,62 @@
 import json
 import os
+import time
 
 from settings import get_settings
 from ..patching.RomData import RomData
 from ..patching.text.decoding import parse_all_texts, decode_text, parse_text_dict
 from ..patching.text.encoding import encode_dict, write_text_data
 
-if __name__ == "__main__":
-    if not os.path.isdir("output"):
-        os.mkdir("output")
-    file_name = get_settings()["tloz_oos_options"]["rom_file"]
+
+def check_game(file_name: str, seasons: bool):
+    game_name = "seasons" if seasons else "ages"
     rom = RomData(bytes(open(file_name, "rb").read()))
-    dict_seasons = parse_text_dict(rom, True)
-    text = parse_all_texts(rom, dict_seasons, True)
+    dict_game = parse_text_dict(rom, seasons)
+    text = parse_all_texts(rom, dict_game, seasons)
 
-    with open("output/seasons_text_dict.json", "w+", encoding="utf-8") as f:
-        json.dump(dict_seasons, f, ensure_ascii=False, indent=4)
+    with open(f"output/{game_name}_text_dict.json", "w+", encoding="utf-8") as f:
+        json.dump(dict_game, f, ensure_ascii=False, indent=4)
 
-    with open("output/seasons_text.json", "w+", encoding="utf-8") as f:
+    with open(f"output/{game_name}_text.json", "w+", encoding="utf-8") as f:
         json.dump(text, f, ensure_ascii=False, indent=4)
 
-    encoded_dict1 = encode_dict(dict_seasons)
-    for key in dict_seasons:
+    start = time.perf_counter()
+    encoded_dict1 = encode_dict(dict_game)
+    print(f"{game_name}: encoded {len(dict_game)} dict entries in {time.perf_counter() - start:.3f}s")
+    for key in dict_game:
         fake_rom = RomData(encoded_dict1[key])
-        assert decode_text(fake_rom, 0) == dict_seasons[key], (decode_text(fake_rom, 0), dict_seasons[0])
+        assert decode_text(fake_rom, 0) == dict_game[key], (decode_text(fake_rom, 0), dict_game[key])
 
-    encoded_dict2 = encode_dict(text, dict_seasons)
+    start = time.perf_counter()
+    encoded_dict2 = encode_dict(text, dict_game)
+    print(f"{game_name}: encoded {len(text)} texts in {time.perf_counter() - start:.3f}s")
     for key in text:
         fake_rom = RomData(encoded_dict2[key])
-        assert decode_text(fake_rom, 0, dict_seasons) == text[key], (decode_text(fake_rom, 0, dict_seasons), text[key])
+        assert decode_text(fake_rom, 0, dict_game) == text[key], (decode_text(fake_rom, 0, dict_game), text[key])
 
-    write_text_data(rom, dict_seasons, text, True)
+    usage = write_text_data(rom, dict_game, text, seasons)
+    for i, bank in enumerate(usage):
+        print(f"{game_name}: text table {i + 1} uses {bank.end - bank.start} bytes, {bank.free_bytes} bytes free")
 
-    dict_seasons2 = parse_text_dict(rom, True)
+    dict_game2 = parse_text_dict(rom, seasons)
 
-    for key in dict_seasons:
-        assert dict_seasons2[key] == dict_seasons[key], (dict_seasons2[key], dict_seasons[key])
+    for key in dict_game:
+        assert dict_game2[key] == dict_game[key], (dict_game2[key], dict_game[key])
 
-    text2 = parse_all_texts(rom, dict_seasons2, True)
+    text2 = parse_all_texts(rom, dict_game2, seasons)
 
     for key in text2:
-        assert text2[key] == text[key], (text2[key], text[key])
\ No newline at end of file
+        assert text2[key] == text[key], (text2[key], text[key])
+
+
+if __name__ == "__main__":
+    if not os.path.isdir("output"):
+        os.mkdir("output")
+    settings = get_settings()
+    check_game(settings["tloz_oos_options"]["rom_file"], True)
+    try:
+        ages_rom_file = settings["tloz_ooa_options"]["rom_file"]
+    except (KeyError, AttributeError):
+        ages_rom_file = None
+    if ages_rom_file:
+        check_game(ages_rom_file, False)
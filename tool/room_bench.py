@@ -0,0 +1,133 @@
+"""
+Offline benchmark and round trip check of room compression, needing no ROM.
+
+Rooms are either synthetic ones generated from a seed, small rooms being mostly made of a common tile and big rooms of
+pieces of the compression dicts of seasons, or the rooms of a real ROM. They are compressed into a blank ROM and
+decompressed back, timing every step and checking that every room decompresses to itself.
+
+Run it from the parent directory of the world, for instance:
+    python -m tloz_oos.common.tool.room_bench
+    python -m tloz_oos.common.tool.room_bench --rom "Legend of Zelda, The - Oracle of Seasons (USA).gbc"
+"""
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from ..patching.RomData import RomData
+from ..patching.rooms import ROOM_LAYOUT_GROUP_TABLE
+from ..patching.rooms.decoding import BIG_ROOM_SIZE, SMALL_ROOM_SIZE, decompress_room_group, decompress_rooms
+from ..patching.rooms.encoding import load_compression_dict, write_room_data
+from ..patching.z80asm.Assembler import GameboyAddress
+
+SEASONS_ROOM_LAYOUT_GROUP_TABLE = GameboyAddress(0x04, 0x4c4c).address_in_rom()
+SEASONS_SMALL_GROUPS = 5
+SEASONS_GROUPS = 7
+
+
+def make_rooms(seed: int) -> list[bytearray]:
+    """
+    Generates rooms looking like the ones of seasons, always the same for a given seed.
+    """
+    rng = random.Random(seed)
+    rooms = []
+    for group in range(SEASONS_GROUPS):
+        if group < SEASONS_SMALL_GROUPS:
+            for _ in range(0x100):
+                common = rng.randrange(0x100)
+                rooms.append(bytearray(common if rng.random() < 0.85 else rng.randrange(0x100)
+                                       for _ in range(SMALL_ROOM_SIZE)))
+        else:
+            compression_dict = load_compression_dict(group * 0x100, True)
+            for _ in range(0x100):
+                room = bytearray()
+                while len(room) < BIG_ROOM_SIZE:
+                    if rng.random() < 0.7:
+                        start = rng.randrange(len(compression_dict) - 18)
+                        room.extend(compression_dict[start:start + rng.randint(3, 18)])
+                    else:
+                        room.append(rng.randrange(0x100))
+                rooms.append(room[:BIG_ROOM_SIZE])
+    return rooms
+
+
+def _timed(timings: dict[str, float], name: str, repeat: int, function: Callable):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    timings[name] = best
+    return result
+
+
+def _write_rooms(rom: RomData, rooms: list[bytearray], optimal_compression: bool) -> str:
+    # write_room_data reports the space left, which is kept out of the timed output
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        write_room_data(rom, rooms, True, optimal_compression)
+    return output.getvalue().strip()
+
+
+def run(rooms: list[bytearray], repeat: int, optimal_compression: bool = False) -> tuple[dict[str, float], list[str]]:
+    """
+    Compresses rooms into a blank ROM with the layout of seasons, then decompresses them back.
+
+    Returns:
+        tuple: The best time of every step, and the round trip errors.
+    """
+    timings = {}
+    errors = []
+
+    rom = RomData(bytes(0x100000))
+    report = _timed(timings, "write_room_data", 1, lambda: _write_rooms(rom, rooms, optimal_compression))
+    print(report)
+    decompressed = _timed(timings, "decompress_rooms", repeat, lambda: decompress_rooms(rom))
+
+    group_table = ROOM_LAYOUT_GROUP_TABLE.bind(rom, SEASONS_ROOM_LAYOUT_GROUP_TABLE, SEASONS_GROUPS)
+    table_addresses = group_table.resolve_column("table_offset")
+    base_addresses = group_table.resolve_column("data_offset")
+    for group, room_type in enumerate(group_table.column("room_type")):
+        name = f"decompress_room_group ({'small' if room_type == 1 else 'big'})"
+        if name not in timings:
+            _timed(timings, name, repeat,
+                   lambda: decompress_room_group(rom, room_type, table_addresses[group], base_addresses[group]))
+
+    for room_id, room in enumerate(rooms):
+        if decompressed[room_id] != room:
+            errors.append(f"Room {room_id:03x} decompresses to {decompressed[room_id].hex()} instead of {room.hex()}")
+    return timings, errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark and round trip check of room compression")
+    parser.add_argument("--rom", type=Path, help="A seasons ROM to take rooms from, instead of synthetic ones")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic rooms")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every step, the best time being kept")
+    parser.add_argument("--optimal", action="store_true", help="Compresses big rooms into the least space possible")
+    args = parser.parse_args()
+
+    if args.rom:
+        rooms = decompress_rooms(RomData(args.rom.read_bytes()))
+    else:
+        rooms = make_rooms(args.seed)
+
+    timings, errors = run(rooms, args.repeat, args.optimal)
+    print(f"{len(rooms)} rooms")
+    for name, seconds in timings.items():
+        print(f"  {name:<36} {seconds * 1000:9.2f} ms")
+
+    for error in errors:
+        print(f"FAIL: {error}")
+    print("FAILED" if errors else "OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Offline benchmark and regression checks of the text subsystem, needing no ROM.
+
+Texts are either a synthetic corpus generated from a seed, or a corpus recorded from a real ROM by oo_text_parser
+(output/{game}_text_dict.json and output/{game}_text.json). They are encoded, packed, written to a blank ROM, parsed
+back and decoded, timing every step and checking that:
+- every text decodes back to itself, and the ROM parses back to the same dictionary and texts,
+- texts are wrapped by normalize_text as expected,
+- encodings and packed tables are byte-identical to the golden ones recorded in tool/fixtures/text_golden.json.
+
+Run it from the parent directory of the world, for instance:
+    python -m tloz_oos.common.tool.text_bench
+    python -m tloz_oos.common.tool.text_bench --texts output/seasons_text.json --dictionary output/seasons_text_dict.json
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from ..patching.RomData import RomData
+from ..patching.text import normalize_text, text_offset_1_table_address_seasons, text_offset_2_table_address_seasons, \
+    text_table_eng_address_seasons
+from ..patching.text.decoding import decode_text, parse_all_texts, parse_text_dict, read_text_addresses
+from ..patching.text.encoding import TextEncoder, build_compact_table, encode_dict, write_text_data
+from ..patching.z80asm.Assembler import GameboyAddress
+
+GOLDEN_FILE = Path(__file__).parent.joinpath("fixtures", "text_golden.json")
+GOLDEN_SEED = 1
+GOLDEN_TEXT_COUNT = 400
+
+_WORDS = ("the a you to of and is in it that for this with on be have are not your can "
+          "Link Maku Tree sword shield seed ring rupee Zelda Din Holodrum Subrosia key dungeon "
+          "treasure chest found got will please thank come here there where what who why "
+          "mountain river village temple tower season spring summer autumn winter essence").split()
+# Control sequences in the form they decode to, so that every text decodes back to itself
+_CONTROLS = ("\\link_name", "\\opt", "\\stop", "\\num1", "\\heartpiece", "\\wait(05)", "\\sfx(4d)", "\\speed(02)",
+             "\\pos(01)", "\\cmd(03)", "\\call(02)", "\\charsfx(01)", "🟥", "⬜", "Ⓐ", "♥", "♪")
+_SEPARATORS = (" ", " ", " ", "\n", ", ", "! ")
+# Texts wrapped by normalize_text, and what they must be wrapped to
+_NORMALIZED_TEXTS = (
+    ("Red Ring", "Red Ring"),
+    ("🟥 Red Ring", "🟥 Red Ring"),
+    ("\\speed(02) Hello there", "\\speed(02) Hello there"),
+    ("🟥Din's🟥 Pixie Sword is held by \\link_name in Holodrum",
+     "🟥Din's🟥 Pixie\nSword is held by\n\\link_name in\nHolodrum"),
+    ("⬜Superlongwordthatneedscutting⬜ ok", "⬜Superlongwordth.⬜\nok"),
+)
+
+
+def make_corpus(seed: int, text_count: int) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Generates a dictionary and texts looking like the ones of the games, always the same for a given seed.
+    """
+    rng = random.Random(seed)
+    fragments = set()
+    while len(fragments) < 0x400:
+        word = rng.choice(_WORDS)
+        kind = rng.random()
+        if kind < 0.4:
+            fragments.add(word + " ")
+        elif kind < 0.7:
+            fragments.add(" " + word)
+        elif kind < 0.85:
+            fragments.add(word[:rng.randint(2, max(2, len(word)))])
+        else:
+            fragments.add(f"{word} {rng.choice(_WORDS)}{rng.randint(0, 99)}")
+    dictionary = {f"DICT{i // 0x100}_{i % 0x100:02x}": fragment for i, fragment in enumerate(sorted(fragments))}
+
+    texts = {}
+    categories = 0x5c
+    for category in range(categories):
+        for subid in range(text_count // categories + (category < text_count % categories)):
+            parts = []
+            for _ in range(rng.randint(2, 25)):
+                parts.append(rng.choice(_CONTROLS) if rng.random() < 0.08 else rng.choice(_WORDS))
+                parts.append(rng.choice(_SEPARATORS))
+            text = "".join(parts).strip()
+            if rng.random() < 0.03:
+                text += f"\\jump({rng.randrange(0x100):02x})"
+            texts[f"TX_{category:02x}{subid:02x}"] = text
+    return dictionary, texts
+
+
+def make_rom(texts: dict[str, str]) -> RomData:
+    """
+    Makes a blank ROM with the text pointers of seasons, text data starting right after the offset tables.
+    """
+    rom = RomData(bytes(0x100000))
+    offsets_end = text_table_eng_address_seasons + (0x64 + 0x400 + len(texts)) * 2
+    rom.write_far_pointer(text_offset_1_table_address_seasons, GameboyAddress(0x1c, 0x4000 + offsets_end % 0x4000))
+    rom.write_far_pointer(text_offset_2_table_address_seasons, GameboyAddress(0x1d, 0x4000))
+    return rom
+
+
+def _timed(timings: dict[str, float], name: str, repeat: int, function: Callable):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    timings[name] = best
+    return result
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def run(dictionary: dict[str, str], texts: dict[str, str], repeat: int) -> tuple[dict[str, float], dict, list[str]]:
+    """
+    Runs every step on the corpus.
+
+    Returns:
+        tuple: The best time of every step, the golden data of the corpus, and the round trip errors.
+    """
+    timings = {}
+    errors = []
+
+    encoded = _timed(timings, "encode_dict (cold)", 1, lambda: encode_dict(texts, dictionary))
+    _timed(timings, "encode_dict (no cache)", repeat,
+           lambda: TextEncoder(None, dictionary, cache_size=0).encode_dict(texts))
+    encoded_dictionary = encode_dict(dictionary)
+    compact_table, compact_offsets = _timed(timings, "build_compact_table", repeat,
+                                            lambda: build_compact_table(encoded))
+
+    for key, text in texts.items():
+        decoded = decode_text(RomData(encoded[key]), 0, dictionary)
+        if decoded != text:
+            errors.append(f"{key} decodes to {decoded!r} instead of {text!r}")
+    for key, entry in dictionary.items():
+        decoded = decode_text(RomData(encoded_dictionary[key]), 0)
+        if decoded != entry:
+            errors.append(f"{key} decodes to {decoded!r} instead of {entry!r}")
+
+    rom = make_rom(texts)
+    usage = _timed(timings, "write_text_data", 1, lambda: write_text_data(rom, dictionary, texts, True))
+    parsed_dictionary = _timed(timings, "parse_text_dict", repeat, lambda: parse_text_dict(rom, True))
+    parsed_texts = _timed(timings, "parse_all_texts", repeat, lambda: parse_all_texts(rom, parsed_dictionary, True))
+    addresses = list(read_text_addresses(rom, True).values())
+    _timed(timings, "decode_text", repeat, lambda: [decode_text(rom, address, parsed_dictionary) for address in addresses])
+    if parsed_dictionary != dictionary:
+        errors.append("The dictionary parsed from the ROM differs")
+    for key in texts:
+        if parsed_texts.get(key) != texts[key]:
+            errors.append(f"{key} is parsed from the ROM as {parsed_texts.get(key)!r} instead of {texts[key]!r}")
+
+    for text, expected in _NORMALIZED_TEXTS:
+        normalized = normalize_text(text)
+        if normalized != expected:
+            errors.append(f"{text!r} is normalized to {normalized!r} instead of {expected!r}")
+
+    golden = {
+        "encodings": {key: bytes(value).hex() for key, value in encoded.items()},
+        "compact_table": _digest(compact_table),
+        "compact_offsets": _digest(json.dumps(compact_offsets, sort_keys=True).encode("utf-8")),
+        "free_bytes": [bank.free_bytes for bank in usage],
+        "rom": _digest(rom.file),
+    }
+    return timings, golden, errors
+
+
+def compare_golden(golden: dict, expected: dict) -> list[str]:
+    errors = []
+    for key, value in expected["encodings"].items():
+        if golden["encodings"].get(key) != value:
+            errors.append(f"{key} is encoded as {golden['encodings'].get(key)} instead of {value}")
+    for name in ("compact_table", "compact_offsets", "free_bytes", "rom"):
+        if golden[name] != expected[name]:
+            errors.append(f"{name} differs from the golden one")
+    return errors
+
+
+def compare_timings(timings: dict[str, float], reference: dict[str, float], tolerance: float) -> list[str]:
+    errors = []
+    for name, seconds in timings.items():
+        if name in reference and seconds > reference[name] * tolerance:
+            errors.append(f"{name} took {seconds:.4f}s, more than {tolerance}x the reference {reference[name]:.4f}s")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark and regression checks of text encoding and decoding")
+    parser.add_argument("--texts", type=Path, help="Recorded texts (JSON), instead of the synthetic corpus")
+    parser.add_argument("--dictionary", type=Path, help="Recorded dictionary (JSON), required with --texts")
+    parser.add_argument("--seed", type=int, default=GOLDEN_SEED, help="Seed of the synthetic corpus")
+    parser.add_argument("--count", type=int, default=GOLDEN_TEXT_COUNT, help="Number of synthetic texts")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every step, the best time being kept")
+    parser.add_argument("--record", action="store_true", help="Records the golden data of the synthetic corpus")
+    parser.add_argument("--timings", type=Path, help="Reference timings (JSON) to compare to")
+    parser.add_argument("--save-timings", type=Path, help="Saves the timings (JSON) as a future reference")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Slowdown allowed against reference timings")
+    args = parser.parse_args()
+
+    if args.texts:
+        if not args.dictionary:
+            parser.error("--dictionary is required with --texts")
+        dictionary = json.loads(args.dictionary.read_text(encoding="utf-8"))
+        texts = json.loads(args.texts.read_text(encoding="utf-8"))
+    else:
+        dictionary, texts = make_corpus(args.seed, args.count)
+    is_golden_corpus = not args.texts and args.seed == GOLDEN_SEED and args.count == GOLDEN_TEXT_COUNT
+
+    timings, golden, errors = run(dictionary, texts, args.repeat)
+    print(f"{len(texts)} texts, {len(dictionary)} dictionary entries")
+    for name, seconds in timings.items():
+        print(f"  {name:<24} {seconds * 1000:9.2f} ms")
+
+    if args.record:
+        if not is_golden_corpus:
+            parser.error(f"Golden data is only recorded for the synthetic corpus of seed {GOLDEN_SEED} "
+                         f"and {GOLDEN_TEXT_COUNT} texts")
+        GOLDEN_FILE.parent.mkdir(parents=True, exist_ok=True)
+        GOLDEN_FILE.write_text(json.dumps(golden, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Recorded golden data to {GOLDEN_FILE}")
+    elif is_golden_corpus:
+        errors.extend(compare_golden(golden, json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))))
+
+    if args.timings:
+        errors.extend(compare_timings(timings, json.loads(args.timings.read_text(encoding="utf-8")), args.tolerance))
+    if args.save_timings:
+        args.save_timings.write_text(json.dumps(timings, indent=1) + "\n", encoding="utf-8")
+
+    for error in errors:
+        print(f"FAIL: {error}")
+    print("FAILED" if errors else "OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())